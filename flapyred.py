@@ -1,8 +1,233 @@
-import pygame as pg
+import os
+import sys
+import time
+import pickle
+import json
+import importlib
+from array import array
 from itertools import cycle
 import random
 from enum import Enum
-from pygame.locals import *
+from flapyred_stats import GameStats
+from flapyred_audio import AudioQueue, NullAudio
+from flapyred_params import GameParams, ParamFile, PipeSchedule
+
+
+class LazyModule:
+    """Stand-in for a module of this file's globals, imported on first attribute access"""
+
+    def __init__(self, name, alias):
+        self.name = name
+        self.alias = alias
+
+    def __getattr__(self, attr):
+        module = importlib.import_module(self.name)
+        # later accesses go straight to the module
+        globals()[self.alias] = module
+        return getattr(module, attr)
+
+
+# pygame is only imported by games that draw, read system events or play sounds,
+# and to compute the size and hitmask of sprites missing from the on-disk mask cache
+pg = LazyModule('pygame', 'pg')
+
+# translate table turning an alpha byte into b'0' (transparent) or b'1' (opaque)
+HITMASK_ALPHA = bytes([48] + [49] * 255)
+
+
+class AssetCache:
+    """Process-wide sprite store shared by every Flappy instance.
+    Each PNG is loaded and converted once, flipped variants and hitmasks are computed once.
+    Sizes and hitmasks can also be kept in an on-disk file so that new processes skip the alpha scan."""
+
+    # every angle the bird is drawn with : FLY turns it from 45 down to -90 by 3 degrees,
+    # GAMEOVER keeps turning it by 7 degrees while above -90
+    PLAYER_ANGLES = range(-96, 46)
+
+    def __init__(self, maskFile=None):
+        self.maskFile = maskFile
+        self.images = {}  # (path, flipped) -> converted surface
+        self.masks = None  # (path, flipped) -> (file stamp, size, hitmask), the on-disk masks read on first use
+        self.masksChanged = False
+        self.rotations = {}  # (image, angle) -> rotated surface, the atlas of bird rotations
+        self.sounds = {}  # path -> sound, loaded on first play
+
+    def loadMasks(self):
+        """masks of the on-disk cache. A missing, unreadable or malformed file gives an empty cache"""
+        self.masks = {}
+        if self.maskFile and os.path.exists(self.maskFile):
+            try:
+                with open(self.maskFile, 'rb') as f:
+                    masks = pickle.load(f)
+                # only keep masks of sprites that did not change since they were computed
+                self.masks = {key: entry for key, entry in masks.items()
+                              if len(entry) == 3 and os.path.exists(key[0]) and entry[0] == AssetCache.stamp(key[0])}
+            except Exception:
+                # whatever the file holds, a cache is never worth failing for
+                self.masks = {}
+        return self.masks
+
+    def stamp(path):
+        """modification time and size of a sprite file, used to invalidate the on-disk masks"""
+        stat = os.stat(path)
+        return stat.st_mtime_ns, stat.st_size
+
+    def image(self, path, flipped=False, alpha=True):
+        """converted sprite, loaded on first use. A video mode must be set"""
+        key = (path, flipped)
+        image = self.images.get(key)
+        if image is None:
+            image = pg.image.load(path)
+            image = image.convert_alpha() if alpha else image.convert()
+            if flipped:
+                image = pg.transform.flip(image, False, True)
+            self.images[key] = image
+        return image
+
+    def sound(self, path):
+        """sound loaded on first use, the mixer is started by the first one. Silent without audio device"""
+        sound = self.sounds.get(path)
+        if sound is None:
+            try:
+                if not pg.mixer.get_init():
+                    pg.mixer.init()
+                sound = pg.mixer.Sound(path)
+            except pg.error:
+                sound = Flappy.NullSound()
+            self.sounds[path] = sound
+        return sound
+
+    def rotated(self, image, angle):
+        """rotated copy of an image : a lookup in the atlas, angles missing from it are computed once"""
+        key = (image, angle)
+        rotated = self.rotations.get(key)
+        if rotated is None:
+            rotated = self.rotations[key] = pg.transform.rotate(image, angle)
+        return rotated
+
+    def rotatedHitmask(self, path, angle):
+        """hitmask of a rotated sprite, aligned on the top left corner where the rotated surface is drawn.
+        Computed on first use"""
+        key = (path, False, angle)
+        masks = self.masks if self.masks is not None else self.loadMasks()
+        entry = masks.get(key)
+        if entry is None:
+            image = self.rotated(self.image(path), angle)
+            entry = (AssetCache.stamp(path), image.get_size(), Flappy.getHitmask(image))
+            self.masks[key] = entry
+            self.masksChanged = True
+        return entry[2]
+
+    def hitmask(self, path, flipped=False):
+        """hitmask of a sprite, does not need a video mode when the image is not loaded yet"""
+        return self.mask(path, flipped)[2]
+
+    def size(self, path, flipped=False):
+        """(width, height) of a sprite"""
+        return self.mask(path, flipped)[1]
+
+    def mask(self, path, flipped):
+        key = (path, flipped)
+        masks = self.masks if self.masks is not None else self.loadMasks()
+        entry = masks.get(key)
+        if entry is None:
+            image = self.images.get(key)
+            if image is None:
+                image = pg.image.load(path)
+                if flipped:
+                    image = pg.transform.flip(image, False, True)
+            entry = (AssetCache.stamp(path), image.get_size(), Flappy.getHitmask(image))
+            self.masks[key] = entry
+            self.masksChanged = True
+        return entry
+
+    def preload(self, game):
+        """load every bird, pipe and background variant of a game with their hitmasks.
+        When the game renders, also load the images and fill the atlas of every bird rotation.
+        Hitmasks of the rotations are not used by collision : rotatedHitmask() computes them on demand"""
+        for path in game.BACKGROUNDS_LIST:
+            game.sprite(path, alpha=False)
+        for paths in game.PLAYERS_LIST:
+            for path in paths:
+                image = game.sprite(path)
+                self.hitmask(path)
+                if game.RENDER:
+                    for angle in AssetCache.PLAYER_ANGLES:
+                        self.rotated(image, angle)
+        for path in game.PIPES_LIST:
+            for flipped in (True, False):
+                game.sprite(path, flipped)
+                self.hitmask(path, flipped)
+        self.save()
+
+    def save(self):
+        """write the hitmasks to the on-disk cache if any was computed"""
+        if not self.maskFile or not self.masksChanged:
+            return
+        folder = os.path.dirname(self.maskFile)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        # write then rename, other processes may be reading the file
+        tmpFile = '%s.%d' % (self.maskFile, os.getpid())
+        with open(tmpFile, 'wb') as f:
+            pickle.dump(self.masks, f, pickle.HIGHEST_PROTOCOL)
+        os.replace(tmpFile, self.maskFile)
+        self.masksChanged = False
+
+
+class PipeStore:
+    """Fixed capacity ring buffer of pipe pairs, oldest first.
+    x, upper pipe y and lower pipe y live in typed arrays : scrolling, spawning and despawning
+    only write into them. serial numbers every spawned pair, to follow a pipe from tick to tick"""
+    __slots__ = ('capacity', 'x', 'upperY', 'lowerY', 'serial', 'head', 'count', 'spawned', 'order')
+
+    def __init__(self, capacity=4):
+        self.capacity = capacity
+        self.x = array('d', [0.0] * capacity)
+        self.upperY = array('i', [0] * capacity)
+        self.lowerY = array('i', [0] * capacity)
+        self.serial = array('q', [0] * capacity)
+        # order[head][count] : slots of the pipes, oldest first
+        self.order = tuple(tuple(tuple((head + i) % capacity for i in range(count)) for count in range(capacity + 1))
+                           for head in range(capacity))
+        self.head = self.count = self.spawned = 0
+
+    def __len__(self):
+        return self.count
+
+    def clear(self):
+        self.head = self.count = 0
+
+    def slots(self):
+        """slot index of every pipe pair, oldest first"""
+        return self.order[self.head][self.count]
+
+    def first(self):
+        """slot index of the oldest pipe pair"""
+        return self.head
+
+    def spawn(self, x, upperY, lowerY):
+        """add a pipe pair after the others"""
+        if self.count == self.capacity:
+            raise OverflowError("more than %d pipes" % self.capacity)
+        slot = (self.head + self.count) % self.capacity
+        self.x[slot] = x
+        self.upperY[slot] = upperY
+        self.lowerY[slot] = lowerY
+        self.serial[slot] = self.spawned
+        self.spawned += 1
+        self.count += 1
+
+    def despawn(self):
+        """remove the oldest pipe pair"""
+        self.head = (self.head + 1) % self.capacity
+        self.count -= 1
+
+    def scroll(self, dx):
+        """move every pipe pair horizontally"""
+        x = self.x
+        for slot in self.order[self.head][self.count]:
+            x[slot] += dx
 
 
 class Flappy:
@@ -19,20 +244,73 @@ class Flappy:
         ACTION = 1
         EXIT = 99
 
-    def __init__(self):
+    # sprites and hitmasks shared by all games of the process
+    ASSETS = AssetCache(os.environ.get('FLAPYRED_MASK_CACHE'))
+
+    # layout of the float32 observation vector, pipes are the next 2 not passed by the player yet
+    OBSERVATION = ('player_y', 'player_vel_y', 'player_rot',
+                   'pipe1_dx', 'pipe1_gap_top', 'pipe1_gap_bottom',
+                   'pipe2_dx', 'pipe2_gap_top', 'pipe2_gap_bottom')
+    OBS_SIZE = len(OBSERVATION)
+    # integer luma weights of the grayscale frame, sum to 256
+    GRAY_WEIGHTS = (77, 150, 29)
+
+    class NullSound:
+        """Silent stand-in for pg.mixer.Sound, used when running headless"""
+        def play(self):
+            pass
+
+    class LazySound:
+        """Sound of the process-wide cache, loaded on first play"""
+        def __init__(self, path):
+            self.path = path
+
+        def play(self):
+            Flappy.ASSETS.sound(self.path).play()
+
+    class NullImage:
+        """Size only stand-in for a sprite surface, used when not rendering"""
+        def __init__(self, size):
+            self.size = size
+
+        def get_size(self):
+            return self.size
+
+        def get_width(self):
+            return self.size[0]
+
+        def get_height(self):
+            return self.size[1]
+
+    def __init__(self, headless=False, render=True, seed=None, stats=False, params=None):
         self.playerHeight = self.crashTest = self.playerFlapped = self.pipeVelX = self.playerVelY = None
         self.playerFlapAcc = self.playerRotThr = self.playerVelRot = self.playerRot = self.playerAccY = None
-        self.playerMinVelY = self.playerMaxVelY = self.lowerPipes = self.upperPipes = self.newPipe2 = None
-        self.newPipe1 = self.score = self.basex = self.loopIter = self.deltay = self.baseShift = None
+        self.playerMinVelY = self.playerMaxVelY = None
+        self.score = self.basex = self.loopIter = self.deltay = self.baseShift = None
         self.messagey = self.messagex = self.playery = self.playerx = self.playerIndexGen = self.playerIndex = None
-
-        self.FPS = 30
+        self.pipeSchedule = self.pipeIndex = None
+
+        # headless : no window, no audio, no FPS throttling. render=False also skips all blits
+        self.HEADLESS = headless
+        self.RENDER = render or not headless
+        # own random generator : skins and pipe gaps do not depend on other games of the process
+        self.RANDOM = random.Random(seed)
+        self.RENDER_FPS = 60  # frames per second drawn by play(), interpolated between ticks
+        self.MAX_FRAME_TIME = 0.25  # longest wall clock time simulated for one frame, slower machines slow down
+        # optional phase timing, frame time percentiles and profiling window. None costs nothing
+        self.STATS = GameStats(1 / self.RENDER_FPS) if stats else None
         self.SCREENWIDTH = 288
         self.SCREENHEIGHT = 512
-        self.PIPEGAPSIZE = 100  # gap between upper and lower part of pipe
         self.BASEY = self.SCREENHEIGHT * 0.79
+        # physics and difficulty, a GameParams or the path of a JSON file read again at PREPARE when it changed
+        self.PARAMS_FILE = ParamFile(params) if isinstance(params, (str, os.PathLike)) else None
+        self.apply_params(self.PARAMS_FILE.params if self.PARAMS_FILE else params or GameParams())
         # image, sound and hitmask  dicts
         self.IMAGES, self.SOUNDS, self.HITMASKS = {}, {}, {}
+        # sound events of the ticks, played by a worker thread once INIT loaded the sounds
+        self.AUDIO = NullAudio()
+        # upper and lower pipes on screen
+        self.pipes = PipeStore()
 
         # list of all possible players (tuple of 3 positions of flap)
         self.PLAYERS_LIST = (
@@ -74,6 +352,7 @@ class Flappy:
         self.GAME_INPUT = Flappy.GameInput.IDLE
 
         self.SCREEN = None
+        self.RENDERER = None
         self.FPSCLOCK = None
 
         self.GAME_HANDLER = {
@@ -85,14 +364,130 @@ class Flappy:
             Flappy.GameState.EXIT: Flappy.game_state_exit
         }
 
-    def play(self):
+    def play(self, inputs=None):
+        """ Main Game loop : fixed timestep simulation of FPS ticks per second, whatever the frame rate.
+        Each frame runs the ticks due since the last one, or none, then draws between the last two ticks.
+        Headless, there are no system events : ticks run back to back with the GameInput returned by
+        inputs(game) for each of them, up to the EXIT state."""
+        if self.HEADLESS and inputs is None:
+            raise ValueError("a headless game reads no system events : play() needs inputs")
         self.game_next_state(Flappy.GameState.INIT)
-        """ Main Game loop"""
+        if self.HEADLESS:
+            while self.GAME_STATE != Flappy.GameState.EXIT:
+                self.game_tick(inputs(self))
+            return
+        lag = 1 / self.FPS  # first tick right away
+        last = time.perf_counter()
+        pending = Flappy.GameInput.IDLE
         while self.GAME_STATE != Flappy.GameState.EXIT:
+            # FPS may change with the parameters of a new round
+            tickTime = 1 / self.FPS
+            if self.STATS:
+                self.STATS.frame_start()
+            # keep input of frames without tick for the next tick
+            game_input = self.game_events()
+            if game_input.value > pending.value:
+                pending = game_input
+            now = time.perf_counter()
+            lag += min(now - last, self.MAX_FRAME_TIME)
+            last = now
+            while lag >= tickTime and self.GAME_STATE != Flappy.GameState.EXIT:
+                self.game_update(pending)
+                pending = Flappy.GameInput.IDLE
+                lag -= tickTime
+            self.game_render(lag / tickTime)
+
+    def game_tick(self, game_input=None):
+        """Run one iteration of the game loop, with the given GameInput or else the pygame event queue"""
+        if self.STATS:
+            self.STATS.frame_start()
+        self.game_update(game_input)
+        self.game_render()
+
+    def game_update(self, game_input=None):
+        """Run one simulation tick, with the given GameInput or else the pygame event queue"""
+        if game_input is None:
             self.game_input()
-            self.GAME_STATE_TICK += 1
-            self.GAME_HANDLER[self.GAME_STATE](self)
-            self.game_render()
+        else:
+            self.GAME_INPUT = game_input
+            if game_input == Flappy.GameInput.EXIT:
+                self.game_next_state(Flappy.GameState.EXIT)
+        self.GAME_STATE_TICK += 1
+        if self.RENDERER:
+            self.RENDERER.tick()
+        if self.STATS:
+            self.STATS.state = self.GAME_STATE
+            self.STATS.enter('simulate')
+        self.GAME_HANDLER[self.GAME_STATE](self)
+        self.AUDIO.flush()
+
+    def reset(self, seed=None):
+        """Start a new round without the event queue, up to the first FLY tick. returns the observation"""
+        if seed is not None:
+            self.RANDOM.seed(seed)
+        if not self.IMAGES:
+            self.game_next_state(Flappy.GameState.INIT)
+            self.game_tick(Flappy.GameInput.IDLE)
+        # PREPARE, then the WELCOME tick that starts to fly, then the FLY start tick
+        self.game_next_state(Flappy.GameState.PREPARE)
+        for game_input in (Flappy.GameInput.IDLE, Flappy.GameInput.ACTION, Flappy.GameInput.IDLE):
+            self.game_tick(game_input)
+        return self.observation()
+
+    def step(self, action):
+        """Run one FLY tick, flapping when action is true. returns observation, reward, done, info
+        reward is +1 for each pipe passed and -1 on crash, done is true once the player crashed"""
+        if not self.HEADLESS:
+            pg.event.pump()
+        if self.GAME_STATE != Flappy.GameState.FLY:
+            return self.observation(), 0, True, {'score': self.score, 'tick': self.GAME_STATE_TICK}
+        score = self.score
+        # FLY tick of this step, read before a crash moves to GAMEOVER and restarts the state tick count
+        tick = self.GAME_STATE_TICK + 1
+        self.game_tick(Flappy.GameInput.ACTION if action else Flappy.GameInput.IDLE)
+        done = self.GAME_STATE != Flappy.GameState.FLY
+        reward = -1 if done else self.score - score
+        return self.observation(), reward, done, {'score': self.score, 'tick': tick}
+
+    def observation(self):
+        """float32 array of Flappy.OBSERVATION : player y, y velocity, rotation,
+        then x distance, gap top and gap bottom of the next 2 pipes (0 when there is no pipe)"""
+        pipeW = self.IMAGES['pipe'][0].get_width()
+        pipeH = self.IMAGES['pipe'][0].get_height()
+        obs = [self.playery, self.playerVelY, self.playerRot]
+        pipes = self.pipes
+        for slot in pipes.slots():
+            # pipes already passed by the player are skipped
+            if pipes.x[slot] + pipeW > self.playerx and len(obs) < Flappy.OBS_SIZE:
+                obs += [pipes.x[slot] - self.playerx, pipes.upperY[slot] + pipeH, pipes.lowerY[slot]]
+        obs += [0] * (Flappy.OBS_SIZE - len(obs))
+        return array('f', obs)
+
+    def frame(self, scale=1, gray=False, out=None):
+        """screen as a (row, column, RGB) uint8 numpy array, a view of the SCREEN pixels without copy.
+        scale keeps one pixel every scale pixels in both directions, still a view.
+        gray computes a (row, column) luma array, in out when given.
+        The view locks the screen : drop it before the next frame is drawn"""
+        view = pg.surfarray.pixels3d(self.SCREEN).transpose(1, 0, 2)
+        if scale > 1:
+            view = view[::scale, ::scale]
+        if not gray:
+            return view
+        import numpy as np
+        luma = np.zeros(view.shape[:2], dtype=np.uint16)
+        for channel, weight in enumerate(Flappy.GRAY_WEIGHTS):
+            luma += np.multiply(view[:, :, channel], weight, dtype=np.uint16)
+        if out is None:
+            out = np.empty(luma.shape, dtype=np.uint8)
+        np.right_shift(luma, 8, out=out, casting='unsafe')
+        return out
+
+    def apply_params(self, params):
+        """use a GameParams pack, the FLY constants of a round are taken when it starts"""
+        self.PIPEGAPMIN, self.PIPEGAPRANGE = params.gapBounds(self.BASEY)
+        self.PARAMS = params
+        self.FPS = params.FPS  # simulation ticks per second, all the physics is expressed per tick
+        self.PIPEGAPSIZE = params.PIPEGAPSIZE  # gap between upper and lower part of pipe
 
     def game_next_state(self, next_state):
         """Set the next game state"""
@@ -106,104 +501,149 @@ class Flappy:
 
     def game_input(self):
         """Translate system input event into game event : exit event will change game state to EXIT"""
-        self.GAME_INPUT = Flappy.GameInput.IDLE
+        self.GAME_INPUT = self.game_events()
+        if self.GAME_INPUT == Flappy.GameInput.EXIT:
+            self.game_next_state(Flappy.GameState.EXIT)
+
+    def game_events(self):
+        """GameInput of the pending system input events, IDLE when there is no display to read them from"""
+        game_input = Flappy.GameInput.IDLE
+        if self.SCREEN is None:
+            # pure logic game : no video system, pygame may not even be imported
+            return game_input
         try:
             for event in pg.event.get():
-                if event.type == QUIT or (event.type == KEYDOWN and event.key == K_ESCAPE):
-                    self.GAME_INPUT = Flappy.GameInput.EXIT
-                if event.type == KEYDOWN and (event.key == K_SPACE or event.key == K_UP):
-                    self.GAME_INPUT = Flappy.GameInput.ACTION
+                if event.type == pg.QUIT or (event.type == pg.KEYDOWN and event.key == pg.K_ESCAPE):
+                    game_input = Flappy.GameInput.EXIT
+                if event.type == pg.KEYDOWN and (event.key == pg.K_SPACE or event.key == pg.K_UP):
+                    game_input = Flappy.GameInput.ACTION
         except:
             pass
-        if self.GAME_INPUT == Flappy.GameInput.EXIT:
-            self.game_next_state(Flappy.GameState.EXIT)
+        return game_input
 
-    def game_render(self):
-        """ Finalise the rendering by showing up all blit that occurs, then wait enough time to respect FPS"""
+    def game_log(self, message):
+        """Print state changes, silent when headless"""
+        if not self.HEADLESS:
+            print(message)
+
+    def game_render(self, alpha=1.0):
+        """ Finalise the rendering by drawing and showing up the areas changed since the last frame,
+        alpha of the way from the previous tick to the last one, then wait enough time to respect RENDER_FPS"""
+        if self.GAME_STATE == Flappy.GameState.EXIT:
+            return
+        stats = self.STATS
+        if stats:
+            stats.enter('draw')
+        dirty = self.RENDERER.end(alpha) if self.RENDER and self.RENDERER else []
+        if self.HEADLESS:
+            if stats:
+                stats.frame_end()
+            return
         try:
-            pg.display.update()
-            self.FPSCLOCK.tick(self.FPS)
+            if stats:
+                stats.enter('present')
+            if dirty:
+                pg.display.update(dirty)
+            if stats:
+                stats.frame_end()
+            self.FPSCLOCK.tick(self.RENDER_FPS)
         except:
             pass
 
     def game_state_init(self):
         """STATE INIT : prepare all needed resource and prepare the SDL context"""
-        print("game init")
-        pg.init()
-        self.FPSCLOCK = pg.time.Clock()
-        self.SCREEN = pg.display.set_mode((self.SCREENWIDTH, self.SCREENHEIGHT))
-        pg.display.set_caption('Flappy Bird')
+        self.game_log("game init")
+        # only the video subsystem : the mixer starts with the first sound played.
+        # Without rendering, pygame is not even imported when the sprites are in the mask cache
+        if not self.HEADLESS:
+            pg.display.init()
+            self.FPSCLOCK = pg.time.Clock()
+        elif self.RENDER and not pg.display.get_init():
+            # offscreen surface only : images still need a video mode to be converted.
+            # The dummy driver, unless the caller chose one (offscreen, ...)
+            os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+            pg.display.init()
+        if self.RENDER:
+            from flapyred_render import DirtyRenderer
+            if not self.HEADLESS:
+                self.SCREEN = pg.display.set_mode((self.SCREENWIDTH, self.SCREENHEIGHT))
+                pg.display.set_caption('Flappy Bird')
+            else:
+                # the renderer keeps the last frame on screen : every headless game of the process
+                # draws on its own surface, the display is shared by all of them
+                if pg.display.get_surface() is None:
+                    pg.display.set_mode((self.SCREENWIDTH, self.SCREENHEIGHT))
+                self.SCREEN = pg.Surface((self.SCREENWIDTH, self.SCREENHEIGHT))
+            self.RENDERER = DirtyRenderer(self.SCREEN)
 
         # numbers sprites for score display
-        self.IMAGES['numbers'] = (
-            pg.image.load('assets/sprites/0.png').convert_alpha(),
-            pg.image.load('assets/sprites/1.png').convert_alpha(),
-            pg.image.load('assets/sprites/2.png').convert_alpha(),
-            pg.image.load('assets/sprites/3.png').convert_alpha(),
-            pg.image.load('assets/sprites/4.png').convert_alpha(),
-            pg.image.load('assets/sprites/5.png').convert_alpha(),
-            pg.image.load('assets/sprites/6.png').convert_alpha(),
-            pg.image.load('assets/sprites/7.png').convert_alpha(),
-            pg.image.load('assets/sprites/8.png').convert_alpha(),
-            pg.image.load('assets/sprites/9.png').convert_alpha()
-        )
+        self.IMAGES['numbers'] = tuple(self.sprite('assets/sprites/%d.png' % digit) for digit in range(10))
 
         # game over sprite
-        self.IMAGES['gameover'] = pg.image.load('assets/sprites/gameover.png').convert_alpha()
+        self.IMAGES['gameover'] = self.sprite('assets/sprites/gameover.png')
         # message sprite for welcome screen
-        self.IMAGES['message'] = pg.image.load('assets/sprites/message.png').convert_alpha()
+        self.IMAGES['message'] = self.sprite('assets/sprites/message.png')
         # base (ground) sprite
-        self.IMAGES['base'] = pg.image.load('assets/sprites/base.png').convert_alpha()
-
-        self.SOUNDS['die'] = pg.mixer.Sound('assets/audio/die.ogg')
-        self.SOUNDS['hit'] = pg.mixer.Sound('assets/audio/hit.ogg')
-        self.SOUNDS['point'] = pg.mixer.Sound('assets/audio/point.ogg')
-        self.SOUNDS['swoosh'] = pg.mixer.Sound('assets/audio/swoosh.ogg')
-        self.SOUNDS['wing'] = pg.mixer.Sound('assets/audio/wing.ogg')
+        self.IMAGES['base'] = self.sprite('assets/sprites/base.png')
+        # every bird, pipe and background variant, so that PREPARE only picks from the cache
+        Flappy.ASSETS.preload(self)
+
+        for name in ('die', 'hit', 'point', 'swoosh', 'wing'):
+            if self.HEADLESS:
+                self.SOUNDS[name] = Flappy.NullSound()
+            else:
+                self.SOUNDS[name] = Flappy.LazySound('assets/audio/%s.ogg' % name)
+        if not self.HEADLESS:
+            self.AUDIO = AudioQueue(self.SOUNDS)
         self.game_next_state(Flappy.GameState.PREPARE)
 
+    def sprite(self, path, flipped=False, alpha=True):
+        """sprite of the process-wide cache : the converted surface when rendering, else only its size"""
+        if self.RENDER:
+            return Flappy.ASSETS.image(path, flipped, alpha)
+        return Flappy.NullImage(Flappy.ASSETS.size(path, flipped))
+
     def game_state_prepare(self):
         """STATE PREPARE : prepare the context for a new game play iteration"""
-        print("game prepare")
+        self.game_log("game prepare")
+        if self.PARAMS_FILE is not None:
+            params = self.PARAMS_FILE.reload(lambda params: params.gapBounds(self.BASEY))
+            if params is not self.PARAMS:
+                self.apply_params(params)
         # select random background sprites
-        randBg = random.randint(0, len(self.BACKGROUNDS_LIST) - 1)
-        self.IMAGES['background'] = pg.image.load(self.BACKGROUNDS_LIST[randBg]).convert()
+        randBg = self.RANDOM.randint(0, len(self.BACKGROUNDS_LIST) - 1)
+        self.IMAGES['background'] = self.sprite(self.BACKGROUNDS_LIST[randBg], alpha=False)
 
         # select random player sprites
-        randPlayer = random.randint(0, len(self.PLAYERS_LIST) - 1)
-        self.IMAGES['player'] = (
-            pg.image.load(self.PLAYERS_LIST[randPlayer][0]).convert_alpha(),
-            pg.image.load(self.PLAYERS_LIST[randPlayer][1]).convert_alpha(),
-            pg.image.load(self.PLAYERS_LIST[randPlayer][2]).convert_alpha(),
-        )
+        randPlayer = self.RANDOM.randint(0, len(self.PLAYERS_LIST) - 1)
+        self.IMAGES['player'] = tuple(self.sprite(path) for path in self.PLAYERS_LIST[randPlayer])
 
         # select random pipe sprites
-        pipeindex = random.randint(0, len(self.PIPES_LIST) - 1)
+        pipePath = self.PIPES_LIST[self.RANDOM.randint(0, len(self.PIPES_LIST) - 1)]
         self.IMAGES['pipe'] = (
-            pg.transform.flip(
-                pg.image.load(self.PIPES_LIST[pipeindex]).convert_alpha(), False, True),
-            pg.image.load(self.PIPES_LIST[pipeindex]).convert_alpha(),
+            self.sprite(pipePath, flipped=True),
+            self.sprite(pipePath),
         )
 
         # hitmask for pipes
         self.HITMASKS['pipe'] = (
-            Flappy.getHitmask(self.IMAGES['pipe'][0]),
-            Flappy.getHitmask(self.IMAGES['pipe'][1]),
+            Flappy.ASSETS.hitmask(pipePath, flipped=True),
+            Flappy.ASSETS.hitmask(pipePath),
         )
 
         # hitmask for player
-        self.HITMASKS['player'] = (
-            Flappy.getHitmask(self.IMAGES['player'][0]),
-            Flappy.getHitmask(self.IMAGES['player'][1]),
-            Flappy.getHitmask(self.IMAGES['player'][2]),
-        )
+        self.HITMASKS['player'] = tuple(Flappy.ASSETS.hitmask(path) for path in self.PLAYERS_LIST[randPlayer])
+
+        # gaps of every pipe of the round, drawn in bulk from a seed of the game generator
+        self.pipeSchedule = PipeSchedule(self.RANDOM.getrandbits(64), self.PIPEGAPMIN, self.PIPEGAPRANGE)
+        self.pipeIndex = 0
         self.game_next_state(Flappy.GameState.WELCOME)
 
     def game_state_welcome(self):
         """STATE: WELCOME : Welcome scene"""
         # First interation in current state
         if self.is_game_start_state():
-            print("game welcome")
+            self.game_log("game welcome")
             """Shows welcome screen animation of flappy bird"""
             # index of player to blit on screen
             self.playerIndex = 0
@@ -229,76 +669,71 @@ class Flappy:
             self.playerIndex = next(self.playerIndexGen)
         self.loopIter = (self.loopIter + 1) % 30
         self.basex = -((-self.basex + 4) % self.baseShift)
-        amplitude = 8
-        framenum = self.GAME_STATE_TICK
-        self.deltay = (framenum % (2 * amplitude) - amplitude) * (-2 * (int(framenum / (2 * amplitude)) % 2) + 1)
+        self.deltay = Flappy.welcomeBob(self.GAME_STATE_TICK)
 
         # draw sprites
-        self.SCREEN.blit(self.IMAGES['background'], (0, 0))
-        self.SCREEN.blit(self.IMAGES['player'][self.playerIndex],
-                         (self.playerx, self.playery + self.deltay))
-        self.SCREEN.blit(self.IMAGES['message'], (self.messagex, self.messagey))
-        self.SCREEN.blit(self.IMAGES['base'], (self.basex, self.BASEY))
+        if not self.RENDER:
+            return
+        if self.STATS:
+            self.STATS.enter('draw')
+        self.RENDERER.begin(self.IMAGES['background'])
+        self.RENDERER.blit(self.IMAGES['player'][self.playerIndex],
+                           (self.playerx, self.playery + self.deltay), 'player')
+        self.RENDERER.blit(self.IMAGES['message'], (self.messagex, self.messagey))
+        self.RENDERER.blit(self.IMAGES['base'], (self.basex, self.BASEY), 'base')
 
     def game_state_play(self):
         """STATE PLAY : The game scene itself"""
         # First interation in current state
         if self.is_game_start_state():
-            print("game fly")
+            self.game_log("game fly")
             self.score = self.playerIndex = self.loopIter = 0
             self.playerx, self.playery = int(self.SCREENWIDTH * 0.2), self.playery + self.deltay
 
             self.baseShift = self.IMAGES['base'].get_width() - self.IMAGES['background'].get_width()
 
-            # get 2 new pipes to add to upperPipes lowerPipes list
-            self.newPipe1 = self.getRandomPipe()
-            self.newPipe2 = self.getRandomPipe()
-
-            # list of upper pipes
-            self.upperPipes = [
-                {'x': self.SCREENWIDTH + 200, 'y': self.newPipe1[0]['y']},
-                {'x': self.SCREENWIDTH + 200 + (self.SCREENWIDTH / 2), 'y': self.newPipe2[0]['y']},
-            ]
-
-            # list of lowerpipe
-            self.lowerPipes = [
-                {'x': self.SCREENWIDTH + 200, 'y': self.newPipe1[1]['y']},
-                {'x': self.SCREENWIDTH + 200 + (self.SCREENWIDTH / 2), 'y': self.newPipe2[1]['y']},
-            ]
+            # 2 first pipes
+            self.pipes.clear()
+            self.spawnPipe(self.SCREENWIDTH + 200)
+            self.spawnPipe(self.SCREENWIDTH + 200 + (self.SCREENWIDTH / 2))
 
-            dt = self.FPSCLOCK.tick(self.FPS) / 1000
-            self.pipeVelX = -128 * dt
+            # fixed timestep : the pipe speed does not depend on the duration of a frame
+            self.pipeVelX = -self.PARAMS.pipeSpeed / self.FPS
 
             # player velocity, max velocity, downward acceleration, acceleration on flap
-            self.playerVelY = -9  # player's velocity along Y, default same as playerFlapped
+            self.playerVelY = self.PARAMS.playerFlapAcc  # player's velocity along Y, default same as playerFlapped
             self.playerMaxVelY = 10  # max vel along Y, max descend speed
             self.playerMinVelY = -8  # min vel along Y, max ascend speed
-            self.playerAccY = 1  # players downward acceleration
+            self.playerAccY = self.PARAMS.playerAccY  # players downward acceleration
             self.playerRot = 45  # player's rotation
             self.playerVelRot = 3  # angular speed
             self.playerRotThr = 20  # rotation threshold
-            self.playerFlapAcc = -9  # players speed on flapping
+            self.playerFlapAcc = self.PARAMS.playerFlapAcc  # players speed on flapping
             self.playerFlapped = False  # True when player flaps
         # Process game event
         if self.GAME_INPUT == Flappy.GameInput.ACTION:
             if self.playery > -2 * self.IMAGES['player'][0].get_height():
                 self.playerVelY = self.playerFlapAcc
                 self.playerFlapped = True
-                self.SOUNDS['wing'].play()
+                self.AUDIO.push('wing')
         # check for crash here
+        if self.STATS:
+            self.STATS.enter('collision')
         self.crashTest = self.checkCrash({'x': self.playerx, 'y': self.playery, 'index': self.playerIndex},
-                                         self.upperPipes, self.lowerPipes)
+                                         self.pipes)
+        if self.STATS:
+            self.STATS.enter('simulate')
         if self.crashTest[0]:
             self.game_next_state(Flappy.GameState.GAMEOVER)
             return
 
         # check for score
         playerMidPos = self.playerx + self.IMAGES['player'][0].get_width() / 2
-        for pipe in self.upperPipes:
-            pipeMidPos = pipe['x'] + self.IMAGES['pipe'][0].get_width() / 2
+        for slot in self.pipes.slots():
+            pipeMidPos = self.pipes.x[slot] + self.IMAGES['pipe'][0].get_width() / 2
             if pipeMidPos <= playerMidPos < pipeMidPos + 4:
                 self.score += 1
-                self.SOUNDS['point'].play()
+                self.AUDIO.push('point')
 
         # playerIndex basex change
         if (self.loopIter + 1) % 3 == 0:
@@ -323,29 +758,26 @@ class Flappy:
         self.playery += min(self.playerVelY, self.BASEY - self.playery - playerHeight)
 
         # move pipes to left
-        for uPipe, lPipe in zip(self.upperPipes, self.lowerPipes):
-            uPipe['x'] += self.pipeVelX
-            lPipe['x'] += self.pipeVelX
+        self.pipes.scroll(self.pipeVelX)
 
         # add new pipe when first pipe is about to touch left of screen
-        if 3 > len(self.upperPipes) > 0 and 0 < self.upperPipes[0]['x'] < 5:
-            newPipe = self.getRandomPipe()
-            self.upperPipes.append(newPipe[0])
-            self.lowerPipes.append(newPipe[1])
+        if 3 > len(self.pipes) > 0 and 0 < self.pipes.x[self.pipes.first()] < 5:
+            self.spawnPipe(self.SCREENWIDTH + 10)
 
         # remove first pipe if its out of the screen
-        if len(self.upperPipes) > 0 and self.upperPipes[0]['x'] < -self.IMAGES['pipe'][0].get_width():
-            self.upperPipes.pop(0)
-            self.lowerPipes.pop(0)
+        if len(self.pipes) > 0 and self.pipes.x[self.pipes.first()] < -self.IMAGES['pipe'][0].get_width():
+            self.pipes.despawn()
 
         # draw sprites
-        self.SCREEN.blit(self.IMAGES['background'], (0, 0))
+        if not self.RENDER:
+            return
+        if self.STATS:
+            self.STATS.enter('draw')
+        self.RENDERER.begin(self.IMAGES['background'])
 
-        for uPipe, lPipe in zip(self.upperPipes, self.lowerPipes):
-            self.SCREEN.blit(self.IMAGES['pipe'][0], (uPipe['x'], uPipe['y']))
-            self.SCREEN.blit(self.IMAGES['pipe'][1], (lPipe['x'], lPipe['y']))
+        self.drawPipes()
 
-        self.SCREEN.blit(self.IMAGES['base'], (self.basex, self.BASEY))
+        self.RENDERER.blit(self.IMAGES['base'], (self.basex, self.BASEY), 'base')
         # print score so player overlaps the score
         self.showScore(self.score)
 
@@ -354,22 +786,22 @@ class Flappy:
         if self.playerRot <= self.playerRotThr:
             visibleRot = self.playerRot
 
-        playerSurface = pg.transform.rotate(self.IMAGES['player'][self.playerIndex], visibleRot)
-        self.SCREEN.blit(playerSurface, (self.playerx, self.playery))
+        playerSurface = Flappy.ASSETS.rotated(self.IMAGES['player'][self.playerIndex], visibleRot)
+        self.RENDERER.blit(playerSurface, (self.playerx, self.playery), 'player')
 
     def game_state_gameover(self):
         """STATE GAME OVER : Game Over Scene"""
         if self.is_game_start_state():
-            print("game over")
+            self.game_log("game over")
             """crashes the player down and shows gameover image"""
             self.playerx = self.SCREENWIDTH * 0.2
             self.playerHeight = self.IMAGES['player'][0].get_height()
             self.playerAccY = 2
             self.playerVelRot = 7
             # play hit and die sounds
-            self.SOUNDS['hit'].play()
+            self.AUDIO.push('hit')
             if not self.crashTest[1]:
-                self.SOUNDS['die'].play()
+                self.AUDIO.push('die')
 
         if self.GAME_INPUT == Flappy.GameInput.ACTION:
             if self.playery + self.playerHeight >= self.BASEY - 1:
@@ -390,23 +822,27 @@ class Flappy:
                 self.playerRot -= self.playerVelRot
 
         # draw sprites
-        self.SCREEN.blit(self.IMAGES['background'], (0, 0))
+        if not self.RENDER:
+            return
+        if self.STATS:
+            self.STATS.enter('draw')
+        self.RENDERER.begin(self.IMAGES['background'])
 
-        for uPipe, lPipe in zip(self.upperPipes, self.lowerPipes):
-            self.SCREEN.blit(self.IMAGES['pipe'][0], (uPipe['x'], uPipe['y']))
-            self.SCREEN.blit(self.IMAGES['pipe'][1], (lPipe['x'], lPipe['y']))
+        self.drawPipes()
 
-        self.SCREEN.blit(self.IMAGES['base'], (self.basex, self.BASEY))
+        self.RENDERER.blit(self.IMAGES['base'], (self.basex, self.BASEY), 'base')
         self.showScore(self.score)
 
-        playerSurface = pg.transform.rotate(self.IMAGES['player'][1], self.playerRot)
-        self.SCREEN.blit(playerSurface, (self.playerx, self.playery))
-        self.SCREEN.blit(self.IMAGES['gameover'], (50, 180))
+        playerSurface = Flappy.ASSETS.rotated(self.IMAGES['player'][1], self.playerRot)
+        self.RENDERER.blit(playerSurface, (self.playerx, self.playery), 'player')
+        self.RENDERER.blit(self.IMAGES['gameover'], (50, 180))
 
     def game_state_exit(self):
         """STATE EXIT : End of the game. No more play. Release SDL context"""
-        print("game exit")
-        pg.quit()
+        self.game_log("game exit")
+        self.AUDIO.close()
+        if self.SCREEN is not None:
+            pg.quit()
 
     def showScore(self, score):
         """displays score in center of screen"""
@@ -419,11 +855,21 @@ class Flappy:
         Xoffset = (self.SCREENWIDTH - totalWidth) / 2
 
         for digit in scoreDigits:
-            self.SCREEN.blit(self.IMAGES['numbers'][digit], (Xoffset, self.SCREENHEIGHT * 0.1))
+            self.RENDERER.blit(self.IMAGES['numbers'][digit], (Xoffset, self.SCREENHEIGHT * 0.1))
             Xoffset += self.IMAGES['numbers'][digit].get_width()
 
-    def checkCrash(self, player, upperPipes, lowerPipes):
-        """returns True if player collides with base or pipes."""
+    def drawPipes(self):
+        """queue the upper and lower pipes, keyed by their serial (bit inverted for lower pipes)"""
+        pipes = self.pipes
+        for slot in pipes.slots():
+            x = pipes.x[slot]
+            self.RENDERER.blit(self.IMAGES['pipe'][0], (x, pipes.upperY[slot]), pipes.serial[slot])
+            self.RENDERER.blit(self.IMAGES['pipe'][1], (x, pipes.lowerY[slot]), ~pipes.serial[slot])
+
+    def checkCrash(self, player, pipes):
+        """returns True if player collides with base or pipes.
+        Pipes are tested in tiers : a pipe pair outside of the player x range is skipped, a player
+        between the gap bounds is safe, only a player crossing a pipe edge is tested pixel by pixel"""
         pi = player['index']
         player['w'] = self.IMAGES['player'][0].get_width()
         player['h'] = self.IMAGES['player'][0].get_height()
@@ -432,71 +878,91 @@ class Flappy:
         if player['y'] + player['h'] >= self.BASEY - 1:
             return [True, True]
         else:
-
-            playerRect = pg.Rect(player['x'], player['y'],
-                                 player['w'], player['h'])
+            # player and upper/lower pipe hitmasks
+            pHitMask = self.HITMASKS['player'][pi]
+            uHitmask = self.HITMASKS['pipe'][0]
+            lHitmask = self.HITMASKS['pipe'][1]
+            px, py = player['x'], player['y']
+            # bounds as pixelCollision sees them : truncated positions, hitmask sizes
+            left, top = int(px), int(py)
+            right, bottom = left + self.IMAGES['player'][pi].get_width(), top + len(pHitMask)
             pipeW = self.IMAGES['pipe'][0].get_width()
-            pipeH = self.IMAGES['pipe'][0].get_height()
-
-            for uPipe, lPipe in zip(upperPipes, lowerPipes):
-                # upper and lower pipe rects
-                uPipeRect = pg.Rect(uPipe['x'], uPipe['y'], pipeW, pipeH)
-                lPipeRect = pg.Rect(lPipe['x'], lPipe['y'], pipeW, pipeH)
-
-                # player and upper/lower pipe hitmasks
-                pHitMask = self.HITMASKS['player'][pi]
-                uHitmask = self.HITMASKS['pipe'][0]
-                lHitmask = self.HITMASKS['pipe'][1]
-
+            upperH = len(uHitmask)
+
+            for slot in pipes.slots():
+                x = pipes.x[slot]
+                pipeX = int(x)
+                if pipeX >= right or pipeX + pipeW <= left:
+                    continue
+                upperY, lowerY = pipes.upperY[slot], pipes.lowerY[slot]
+                if top >= upperY + upperH and bottom <= lowerY:
+                    continue
                 # if bird collided with upipe or lpipe
-                uCollide = Flappy.pixelCollision(playerRect, uPipeRect, pHitMask, uHitmask)
-                lCollide = Flappy.pixelCollision(playerRect, lPipeRect, pHitMask, lHitmask)
-
-                if uCollide or lCollide:
+                if Flappy.pixelCollision(px, py, pHitMask, x, upperY, uHitmask) or \
+                        Flappy.pixelCollision(px, py, pHitMask, x, lowerY, lHitmask):
                     return [True, False]
 
         return [False, False]
 
-    def pixelCollision(rect1, rect2, hitmask1, hitmask2):
-        """Checks if two objects collide and not just their rects"""
-        rect = rect1.clip(rect2)
-
-        if rect.width == 0 or rect.height == 0:
-            return False
-
-        x1, y1 = rect.x - rect1.x, rect.y - rect1.y
-        x2, y2 = rect.x - rect2.x, rect.y - rect2.y
-
-        for x in range(rect.width):
-            for y in range(rect.height):
-                if hitmask1[x1 + x][y1 + y] and hitmask2[x2 + x][y2 + y]:
-                    return True
+    def pixelCollision(x1, y1, hitmask1, x2, y2, hitmask2):
+        """Checks if two objects collide and not just their rects.
+        Positions are truncated like pg.Rect does, then each overlapping row is tested with a shifted AND"""
+        x1, y1, x2, y2 = int(x1), int(y1), int(x2), int(y2)
+        shift = x2 - x1
+        for y in range(max(y1, y2), min(y1 + len(hitmask1), y2 + len(hitmask2))):
+            row2 = hitmask2[y - y2]
+            if shift >= 0:
+                row2 <<= shift
+            else:
+                row2 >>= -shift
+            if hitmask1[y - y1] & row2:
+                return True
         return False
 
+    def welcomeBob(framenum, amplitude=8):
+        """vertical offset of the bird bobbing on the welcome screen at a WELCOME state tick.
+        The tick leaving WELCOME has restarted the state tick count : FLY starts from welcomeBob(0)"""
+        return (framenum % (2 * amplitude) - amplitude) * (-2 * (int(framenum / (2 * amplitude)) % 2) + 1)
+
     def getRandomPipe(self):
-        """returns a randomly generated pipe"""
-        # y of gap between upper and lower pipe
-        gapY = random.randrange(0, int(self.BASEY * 0.6 - self.PIPEGAPSIZE))
-        gapY += int(self.BASEY * 0.2)
-        pipeHeight = self.IMAGES['pipe'][0].get_height()
-        pipeX = self.SCREENWIDTH + 10
-
-        return [
-            {'x': pipeX, 'y': gapY - pipeHeight},  # upper pipe
-            {'x': pipeX, 'y': gapY + self.PIPEGAPSIZE},  # lower pipe
-        ]
+        """returns the y of the gap between upper and lower pipe of the next pipe, from the round schedule"""
+        gapY = self.pipeSchedule.gap(self.pipeIndex)
+        self.pipeIndex += 1
+        return gapY
+
+    def spawnPipe(self, x):
+        """add a randomly generated pipe at x"""
+        gapY = self.getRandomPipe()
+        self.pipes.spawn(x, gapY - self.IMAGES['pipe'][0].get_height(), gapY + self.PIPEGAPSIZE)
 
     def getHitmask(image):
-        """returns a hitmask using an image's alpha."""
-        mask = []
-        for x in range(image.get_width()):
-            mask.append([])
-            for y in range(image.get_height()):
-                mask[x].append(bool(image.get_at((x, y))[3]))
-        return mask
+        """returns a hitmask using an image's alpha : one integer per row, bit x is set when pixel x is opaque"""
+        width, height = image.get_size()
+        alpha = pg.image.tobytes(image, 'RGBA')[3::4]
+        return tuple(int(alpha[y * width:(y + 1) * width].translate(HITMASK_ALPHA)[::-1], 2)
+                     for y in range(height))
+
+
+def headless_throughput(ticks, flap_every=12):
+    """Run a headless game with a scripted flap every few ticks, return the number of ticks per second"""
+    game = Flappy(headless=True, render=False)
+    game.game_next_state(Flappy.GameState.INIT)
+    start = time.perf_counter()
+    for tick in range(ticks):
+        game.game_tick(Flappy.GameInput.ACTION if tick and tick % flap_every == 0 else Flappy.GameInput.IDLE)
+    return ticks / (time.perf_counter() - start)
 
 
 if __name__ == '__main__':
-    print("Get ready")
-    Flappy().play()
-    print("Bye bye")
+    if '--headless' in sys.argv:
+        print("%.0f ticks/s" % headless_throughput(100000))
+    else:
+        print("Get ready")
+        game = Flappy(stats='--stats' in sys.argv)
+        if game.STATS:
+            # kill -USR1 prints the statistics, kill -USR2 profiles the next frames
+            game.STATS.install_signals()
+        game.play()
+        if game.STATS:
+            print(json.dumps(game.STATS.dump(), indent=2))
+        print("Bye bye")
@@ -0,0 +1,80 @@
+import queue
+import threading
+
+
+class AudioQueue:
+    """Sound events of the game played by a worker thread, so that a stalled mixer never delays a tick.
+
+    Handlers push sound names during a tick, a name pushed twice in the same tick is played once.
+    flush() hands the sounds of the tick to the worker. When the worker is that far behind
+    that the queue is full, the sounds of the tick are dropped and counted."""
+
+    def __init__(self, sounds, size=8):
+        self.sounds = sounds  # name -> object with a play() method, only used by the worker
+        self.pending = []  # names pushed during the current tick
+        self.queue = queue.Queue(size)
+        self.dropped = 0
+        self.thread = None
+
+    def push(self, name):
+        """queue a sound of the current tick"""
+        if name not in self.pending:
+            self.pending.append(name)
+
+    def flush(self):
+        """end of the tick : send its sounds to the worker, without waiting"""
+        if not self.pending:
+            return
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.work, name='flapyred-audio', daemon=True)
+            self.thread.start()
+        try:
+            self.queue.put_nowait(tuple(self.pending))
+        except queue.Full:
+            self.dropped += len(self.pending)
+        self.pending.clear()
+
+    def work(self):
+        """worker thread : play the sounds of each tick until close()"""
+        while True:
+            names = self.queue.get()
+            if names is None:
+                break
+            for name in names:
+                try:
+                    self.sounds[name].play()
+                except Exception:
+                    pass
+
+    def close(self):
+        """stop the worker once it played the queued sounds, without waiting more than a second.
+        When the worker is stalled with a full queue, the queued sounds are dropped"""
+        self.pending.clear()
+        if self.thread is None:
+            return
+        try:
+            self.queue.put_nowait(None)
+        except queue.Full:
+            # only the worker takes from the queue : once drained, there is room for the stop marker
+            try:
+                while True:
+                    self.dropped += len(self.queue.get_nowait())
+            except queue.Empty:
+                pass
+            self.queue.put_nowait(None)
+        self.thread.join(1)
+        self.thread = None
+
+
+class NullAudio:
+    """Audio backend of simulations : sound events are ignored and the mixer is never touched"""
+    dropped = 0
+
+    def push(self, name):
+        pass
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
@@ -0,0 +1,227 @@
+import numpy as np
+
+from flapyred import Flappy
+from flapyred_params import PipeSchedule
+
+
+class FlappyBatch:
+    """N independent FLY games stepped in lockstep, all state held in NumPy arrays.
+
+    Physics, scoring, pipe spawning and pixel collision follow Flappy.game_state_play tick for tick,
+    with the GameParams given as params (a pack or the path of a JSON file, read again on a full reset()).
+    A game that crashes is reset on the same step (its final score is reported in info)."""
+
+    MAX_PIPES = 3  # game_state_play never holds more than 3 pipes
+    OBS_SIZE = Flappy.OBS_SIZE
+
+    def __init__(self, n, seed=None, player=0, pipe=0, params=None):
+        game = self.game = Flappy(headless=True, render=False, params=params)
+        self.n = n
+        self.rng = np.random.default_rng(seed)
+        self.SCREENWIDTH = game.SCREENWIDTH
+        self.BASEY = game.BASEY
+        self.apply_params()
+
+        # sprites are only needed for their size and hitmask
+        playerPaths = game.PLAYERS_LIST[player]
+        pipePath = game.PIPES_LIST[pipe]
+        self.playerW, self.playerH = Flappy.ASSETS.size(playerPaths[0])
+        self.pipeW, self.pipeH = Flappy.ASSETS.size(pipePath)
+        self.playerx = int(game.SCREENWIDTH * 0.2)
+        # FLY starts where the welcome screen left the bird bobbing
+        self.playerStartY = int((game.SCREENHEIGHT - self.playerH) / 2) + Flappy.welcomeBob(0)
+
+        # collision lookup : [player index, upper/lower pipe, pipe y - player y, pipe x - player x]
+        pipeMasks = (Flappy.ASSETS.hitmask(pipePath, flipped=True), Flappy.ASSETS.hitmask(pipePath))
+        self.crashTable = np.array([
+            [FlappyBatch.collisionTable(Flappy.ASSETS.hitmask(path), self.playerW, mask, self.pipeW)
+             for mask in pipeMasks]
+            for path in playerPaths])
+        self.playerIndexCycle = np.array([0, 1, 2, 1])
+
+        self.playery = np.zeros(n)
+        self.playerVelY = np.zeros(n)
+        self.playerRot = np.zeros(n)
+        self.playerIndexPhase = np.zeros(n, dtype=np.int64)
+        self.playerIndex = np.zeros(n, dtype=np.int64)
+        self.loopIter = np.zeros(n, dtype=np.int64)
+        self.score = np.zeros(n, dtype=np.int64)
+        self.ticks = np.zeros(n, dtype=np.int64)
+        self.pipeX = np.zeros((n, self.MAX_PIPES))
+        self.pipeGapY = np.zeros((n, self.MAX_PIPES), dtype=np.int64)
+        self.pipeCount = np.zeros(n, dtype=np.int64)
+        # gaps of the next pipes of every game, drawn in bulk at reset and when a game used them all
+        self.gapSchedule = np.zeros((n, PipeSchedule.BLOCK), dtype=np.int64)
+        self.pipeIndex = np.zeros(n, dtype=np.int64)
+        self.obs = np.zeros((n, self.OBS_SIZE), dtype=np.float32)
+        self.reset()
+
+    def apply_params(self):
+        """take the physics and difficulty of the GameParams of the game"""
+        game = self.game
+        self.params = game.PARAMS
+        self.PIPEGAPSIZE = game.PIPEGAPSIZE
+        self.gapMin, self.gapRange = game.PIPEGAPMIN, game.PIPEGAPRANGE
+        self.pipeVelX = -game.PARAMS.pipeSpeed / game.FPS
+        self.playerFlapAcc = game.PARAMS.playerFlapAcc
+        self.playerAccY = game.PARAMS.playerAccY
+
+    def reset(self, games=None):
+        """Start a new FLY round for the selected games (all of them by default), return observations.
+        A full reset first reads the parameter file again when it changed"""
+        if games is None:
+            games = np.arange(self.n)
+            if self.game.PARAMS_FILE is not None:
+                params = self.game.PARAMS_FILE.reload(lambda params: params.gapBounds(self.BASEY))
+                if params is not self.params:
+                    self.game.apply_params(params)
+                    self.apply_params()
+        self.playery[games] = self.playerStartY
+        self.playerVelY[games] = self.playerFlapAcc
+        self.playerRot[games] = 45
+        self.playerIndexPhase[games] = 0
+        self.playerIndex[games] = 0
+        self.loopIter[games] = 0
+        self.score[games] = 0
+        self.ticks[games] = 0
+        self.pipeX[games] = 0
+        self.pipeX[games, 0] = self.SCREENWIDTH + 200
+        self.pipeX[games, 1] = self.SCREENWIDTH + 200 + (self.SCREENWIDTH / 2)
+        self.gapSchedule[games] = self.randomGapY(games)
+        self.pipeGapY[games] = 0
+        self.pipeGapY[games, :2] = self.gapSchedule[games, :2]
+        self.pipeIndex[games] = 2
+        self.pipeCount[games] = 2
+        return self.observe()
+
+    def randomGapY(self, games):
+        """y of the gaps of the next PipeSchedule.BLOCK pipes of the selected games, drawn in bulk.
+        A subclass may give its own gaps"""
+        return self.rng.integers(0, self.gapRange, size=(len(games), PipeSchedule.BLOCK)) + self.gapMin
+
+    def nextGapY(self, games):
+        """vectorized getRandomPipe : the next gap of the schedule of each game"""
+        used = games[self.pipeIndex[games] == PipeSchedule.BLOCK]
+        if len(used):
+            self.gapSchedule[used] = self.randomGapY(used)
+            self.pipeIndex[used] = 0
+        gapY = self.gapSchedule[games, self.pipeIndex[games]]
+        self.pipeIndex[games] += 1
+        return gapY
+
+    def step(self, actions):
+        """Advance every game by one tick. actions : array of N booleans (flap or not).
+        returns observations, rewards, dones, info"""
+        actions = np.asarray(actions, dtype=bool)
+        self.ticks += 1
+
+        # flap
+        flapped = actions & (self.playery > -2 * self.playerH)
+        self.playerVelY[flapped] = self.playerFlapAcc
+
+        # check for crash
+        done = self.checkCrash()
+        alive = ~done
+
+        # check for score
+        playerMidPos = self.playerx + self.playerW / 2
+        pipeMidPos = self.pipeX + self.pipeW / 2
+        active = np.arange(self.MAX_PIPES) < self.pipeCount[:, None]
+        points = (active & (pipeMidPos <= playerMidPos) & (playerMidPos < pipeMidPos + 4)).sum(axis=1)
+        points[done] = 0
+        self.score += points
+
+        # playerIndex change
+        cycling = alive & ((self.loopIter + 1) % 3 == 0)
+        self.playerIndex[cycling] = self.playerIndexCycle[self.playerIndexPhase[cycling]]
+        self.playerIndexPhase[cycling] = (self.playerIndexPhase[cycling] + 1) % 4
+        self.loopIter[alive] = (self.loopIter[alive] + 1) % 30
+
+        # rotate the player
+        self.playerRot[alive & (self.playerRot > -90)] -= 3
+
+        # player's movement
+        falling = alive & ~flapped & (self.playerVelY < 10)
+        self.playerVelY[falling] += self.playerAccY
+        self.playerRot[alive & flapped] = 45
+        self.playery[alive] += np.minimum(self.playerVelY, self.BASEY - self.playery - self.playerH)[alive]
+
+        # move pipes to left
+        self.pipeX[alive] += self.pipeVelX
+
+        # add new pipe when first pipe is about to touch left of screen
+        spawn = np.flatnonzero(alive & (self.pipeCount > 0) & (self.pipeCount < 3) &
+                               (0 < self.pipeX[:, 0]) & (self.pipeX[:, 0] < 5))
+        self.pipeX[spawn, self.pipeCount[spawn]] = self.SCREENWIDTH + 10
+        self.pipeGapY[spawn, self.pipeCount[spawn]] = self.nextGapY(spawn)
+        self.pipeCount[spawn] += 1
+
+        # remove first pipe if its out of the screen
+        despawn = alive & (self.pipeCount > 0) & (self.pipeX[:, 0] < -self.pipeW)
+        self.pipeX[despawn, :-1] = self.pipeX[despawn, 1:]
+        self.pipeGapY[despawn, :-1] = self.pipeGapY[despawn, 1:]
+        self.pipeCount[despawn] -= 1
+
+        rewards = points.astype(np.float32)
+        rewards[done] = -1
+        info = {'score': self.score.copy(), 'ticks': self.ticks.copy()}
+        finished = np.flatnonzero(done)
+        if len(finished):
+            self.reset(finished)
+        return self.observe(), rewards, done, info
+
+    def checkCrash(self):
+        """vectorized Flappy.checkCrash : True for every game whose player hits the base or a pipe"""
+        crash = self.playery + self.playerH >= self.BASEY - 1
+        playery = np.trunc(self.playery).astype(np.int64)[:, None]
+        offsetX = np.trunc(self.pipeX).astype(np.int64) - self.playerx + (self.pipeW - 1)
+        active = np.arange(self.MAX_PIPES) < self.pipeCount[:, None]
+        active &= (offsetX >= 0) & (offsetX < self.pipeW + self.playerW - 1)
+        offsetX = np.where(active, offsetX, 0)
+        playerIndex = np.broadcast_to(self.playerIndex[:, None], offsetX.shape)
+        for side, pipeY in enumerate((self.pipeGapY - self.pipeH, self.pipeGapY + self.PIPEGAPSIZE)):
+            offsetY = pipeY - playery + (self.pipeH - 1)
+            inRange = active & (offsetY >= 0) & (offsetY < self.pipeH + self.playerH - 1)
+            offsetY = np.where(inRange, offsetY, 0)
+            hit = self.crashTable[playerIndex, side, offsetY, offsetX] & inRange
+            crash |= hit.any(axis=1)
+        return crash
+
+    def observe(self):
+        """fill and return the (n, OBS_SIZE) float32 observation array, in the layout of Flappy.OBSERVATION"""
+        obs = self.obs
+        obs[:, 0] = self.playery
+        obs[:, 1] = self.playerVelY
+        obs[:, 2] = self.playerRot
+        # pipes already passed by the player are skipped, empty slots are not pipes
+        active = np.arange(self.MAX_PIPES) < self.pipeCount[:, None]
+        passed = (active & (self.pipeX + self.pipeW <= self.playerx)).sum(axis=1)
+        rows = np.arange(self.n)
+        for k in range(2):
+            slot = np.minimum(passed + k, self.MAX_PIPES - 1)
+            present = passed + k < self.pipeCount
+            gapY = self.pipeGapY[rows, slot]
+            obs[:, 3 + 3 * k] = np.where(present, self.pipeX[rows, slot] - self.playerx, 0)
+            obs[:, 4 + 3 * k] = np.where(present, gapY, 0)
+            obs[:, 5 + 3 * k] = np.where(present, gapY + self.PIPEGAPSIZE, 0)
+        return obs
+
+    def collisionTable(hitmask1, width1, hitmask2, width2):
+        """precompute Flappy.pixelCollision for every relative position where the two rects overlap.
+        table[y2 - y1 + len(hitmask2) - 1, x2 - x1 + width2 - 1]"""
+        mask1 = FlappyBatch.maskArray(hitmask1, width1)
+        mask2 = FlappyBatch.maskArray(hitmask2, width2)
+        h1, h2 = len(hitmask1), len(hitmask2)
+        padded = np.zeros((h2 + 2 * h1, width2 + 2 * width1), dtype=bool)
+        padded[h1:h1 + h2, width1:width1 + width2] = mask2
+        padded = padded[::-1, ::-1]
+        table = np.zeros((h1 + h2 - 1, width1 + width2 - 1), dtype=bool)
+        # OR the (flipped) second mask into the table once per opaque pixel of the first one
+        for y, x in zip(*np.nonzero(mask1)):
+            table |= padded[h1 - y:h1 - y + h1 + h2 - 1, width1 - x:width1 - x + width1 + width2 - 1]
+        return table
+
+    def maskArray(hitmask, width):
+        """row bitmask hitmask to a 2D boolean array"""
+        return np.array([[(row >> x) & 1 for x in range(width)] for row in hitmask], dtype=bool)
+
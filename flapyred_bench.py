@@ -0,0 +1,154 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+# results go to stdout as JSON : keep it free of the pygame banner
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+import pygame as pg
+
+from flapyred import Flappy, PipeStore
+
+
+def scripted_input(tick, flap_every=12):
+    """flap every few ticks : enough to fly through some pipes, crash and restart"""
+    return Flappy.GameInput.ACTION if tick % flap_every == 0 else Flappy.GameInput.IDLE
+
+
+def bench_states(ticks=20000, render=False, seed=0):
+    """ticks per second of every GameState handler, and of the frame drawing when rendering"""
+    game = Flappy(headless=True, render=render, seed=seed)
+    game.game_update(Flappy.GameInput.IDLE)
+    handlerTime, renderTime, count = defaultdict(float), defaultdict(float), defaultdict(int)
+    clock = time.perf_counter
+    for tick in range(ticks):
+        state = game.GAME_STATE.name
+        start = clock()
+        game.game_update(scripted_input(tick))
+        middle = clock()
+        game.game_render()
+        end = clock()
+        handlerTime[state] += middle - start
+        renderTime[state] += end - middle
+        count[state] += 1
+    result = {}
+    for state in count:
+        result[state] = {'ticks': count[state], 'ticks_per_s': count[state] / handlerTime[state]}
+        if render:
+            result[state]['frame_ms'] = renderTime[state] * 1000 / count[state]
+    return result
+
+
+def bench_collision(calls=20000, seed=0):
+    """cost of pixelCollision between the bird and a pipe for several overlap sizes,
+    and of checkCrash at the positions and pipes met during games flying through the gaps"""
+    game = Flappy(headless=True, render=False, seed=seed)
+    game.reset(seed)
+    playerMask = game.HITMASKS['player'][0]
+    pipeMask = game.HITMASKS['pipe'][1]
+    playerW, playerH = game.IMAGES['player'][0].get_size()
+    pipeX, pipeY = 100, 300
+    result = {'pixelCollision': {}}
+    # bird overlapping the top left corner of a lower pipe by n x n pixels
+    for overlap in (0, 1, 4, 8, 16, min(playerW, playerH)):
+        x, y = pipeX - playerW + overlap, pipeY - playerH + overlap
+        start = time.perf_counter()
+        for _ in range(calls):
+            hit = Flappy.pixelCollision(x, y, playerMask, pipeX, pipeY, pipeMask)
+        elapsed = time.perf_counter() - start
+        result['pixelCollision'][str(overlap)] = {'us_per_call': elapsed * 1e6 / calls, 'hit': hit}
+
+    # checkCrash on recorded FLY positions, each with the pipes it was tested against
+    positions = []
+    obs = game.reset(seed)
+    tick = 0
+    while len(positions) < 2000:
+        positions.append((game.playerx, game.playery, game.playerIndex, pipeSnapshot(game.pipes)))
+        # flap when the bottom of the bird gets close to the bottom of the next gap, with some mistakes
+        obs, reward, done, info = game.step(obs[0] + 24 > obs[5] - 12 or tick % 37 == 0)
+        tick += 1
+        if done:
+            obs = game.reset()
+    # share of the positions with a pipe in the x range of the bird : not rejected by the first tier
+    pipeW = game.IMAGES['pipe'][0].get_width()
+    crossing = sum(any(int(pipes.x[slot]) < x + playerW and int(pipes.x[slot]) + pipeW > x for slot in pipes.slots())
+                   for x, y, index, pipes in positions)
+    start = time.perf_counter()
+    for _ in range(max(1, calls // len(positions))):
+        for x, y, index, pipes in positions:
+            game.checkCrash({'x': x, 'y': y, 'index': index}, pipes)
+    elapsed = time.perf_counter() - start
+    result['checkCrash'] = {'us_per_call': elapsed * 1e6 / (max(1, calls // len(positions)) * len(positions)),
+                            'pipe_crossing_share': crossing / len(positions)}
+    return result
+
+
+def pipeSnapshot(pipes):
+    """copy of the pipe pairs of a PipeStore, the game keeps moving its own"""
+    snapshot = PipeStore(pipes.capacity)
+    for slot in pipes.slots():
+        snapshot.spawn(pipes.x[slot], pipes.upperY[slot], pipes.lowerY[slot])
+    return snapshot
+
+
+def bench_load(rounds=200):
+    """import and INIT time of a fresh process (cold start), rendering or not, and PREPARE time of a running game.
+    Fresh processes share a mask cache filled by a first run, as a pool of workers would"""
+    code = ("import sys, time; t = time.perf_counter()\n"
+            "from flapyred import Flappy\n"
+            "imported = time.perf_counter()\n"
+            "game = Flappy(headless=True, render=%s)\n"
+            "game.game_update(Flappy.GameInput.IDLE)\n"
+            "print(imported - t, time.perf_counter() - imported, 'pygame' in sys.modules)\n")
+    result = {}
+    with tempfile.TemporaryDirectory() as folder:
+        env = dict(os.environ, FLAPYRED_MASK_CACHE=os.path.join(folder, 'masks.pickle'))
+        for render in (True, False):
+            command = [sys.executable, '-c', code % render]
+            subprocess.run(command, env=env, capture_output=True, check=True)
+            output = subprocess.run(command, env=env, capture_output=True, text=True, check=True).stdout
+            importTime, initTime, pygameImported = output.split()[-3:]
+            result['render' if render else 'logic'] = {'import_ms': float(importTime) * 1000,
+                                                       'init_ms': float(initTime) * 1000,
+                                                       'pygame_imported': pygameImported == 'True'}
+
+    game = Flappy(headless=True, render=False)
+    game.game_update(Flappy.GameInput.IDLE)
+    start = time.perf_counter()
+    for _ in range(rounds):
+        game.game_next_state(Flappy.GameState.PREPARE)
+        game.game_update(Flappy.GameInput.IDLE)
+    result['prepare_ms'] = (time.perf_counter() - start) / rounds * 1000
+    return result
+
+
+def run(ticks=20000, calls=20000):
+    return {
+        'python': platform.python_version(),
+        'pygame': pg.version.ver,
+        'machine': platform.machine(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'states': bench_states(ticks),
+        'states_rendered': bench_states(ticks // 4, render=True),
+        'collision': bench_collision(calls),
+        'load': bench_load(),
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Flappy benchmarks, results as JSON")
+    parser.add_argument('--ticks', type=int, default=20000, help="ticks of the scripted game per state benchmark")
+    parser.add_argument('--calls', type=int, default=20000, help="calls per collision benchmark")
+    parser.add_argument('--output', help="JSON file to write, default stdout")
+    args = parser.parse_args()
+    results = run(args.ticks, args.calls)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    else:
+        print(json.dumps(results, indent=2))
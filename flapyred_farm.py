@@ -0,0 +1,192 @@
+import json
+import multiprocessing as mp
+import sys
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from flapyred import Flappy
+
+OBS_SIZE = Flappy.OBS_SIZE
+FRAME_SHAPE = (512, 288, 3)  # rows, columns, RGB
+
+# commands written by the parent in the control block
+STEP = 0
+RESET = 1
+CLOSE = 2
+
+
+class RolloutFarm:
+    """Headless Flappy games spread over worker processes, stepped in lockstep by the parent.
+
+    Workers write observations, rewards, done flags, scores and optionally rendered frames
+    into a shared memory ring buffer of `ring` slots : step() returns views of one slot,
+    which stay valid until the ring wraps around. Games are reset as soon as they are done."""
+
+    def __init__(self, workers, envs_per_worker=1, frames=False, ring=2, seed=None):
+        self.workers = workers
+        self.n = workers * envs_per_worker
+        self.ring = ring
+        self.slot = 0
+        self.frames = frames
+        layout, size = RolloutFarm.sharedLayout(self.n, ring, frames)
+        self.shm = shared_memory.SharedMemory(create=True, size=size)
+        self.arrays = RolloutFarm.attach(self.shm, layout)
+        self.start = [mp.Semaphore(0) for _ in range(workers)]
+        self.finished = mp.Semaphore(0)
+        self.processes = []
+        for worker in range(workers):
+            games = range(worker * envs_per_worker, (worker + 1) * envs_per_worker)
+            process = mp.Process(target=RolloutFarm.work, daemon=True,
+                                 args=(self.shm.name, layout, games, seed,
+                                       self.start[worker], self.finished))
+            process.start()
+            self.processes.append(process)
+
+    def sharedLayout(n, ring, frames):
+        """offset, shape and dtype of every array of the shared block, and the block size"""
+        arrays = {
+            'control': ((2,), np.int64),
+            'actions': ((n,), np.uint8),
+            'obs': ((ring, n, OBS_SIZE), np.float32),
+            'reward': ((ring, n), np.float32),
+            'done': ((ring, n), np.bool_),
+            'score': ((ring, n), np.int32),
+        }
+        if frames:
+            arrays['frames'] = ((ring, n) + FRAME_SHAPE, np.uint8)
+        layout, offset = {}, 0
+        for name, (shape, dtype) in arrays.items():
+            layout[name] = (offset, shape, dtype)
+            offset += int(np.prod(shape)) * np.dtype(dtype).itemsize
+            offset = (offset + 63) & ~63
+        return layout, offset
+
+    def attach(shm, layout):
+        """numpy views of the shared block"""
+        return {name: np.ndarray(shape, dtype=dtype, buffer=shm.buf, offset=offset)
+                for name, (offset, shape, dtype) in layout.items()}
+
+    def work(shm_name, layout, games, seed, start, finished):
+        """worker process : run its games each time the parent releases the start semaphore"""
+        shm = shared_memory.SharedMemory(name=shm_name)
+        arrays = RolloutFarm.attach(shm, layout)
+        control, actions = arrays['control'], arrays['actions']
+        frames = arrays.get('frames')
+        try:
+            envs = {game: Flappy(headless=True, render=frames is not None) for game in games}
+            while True:
+                start.acquire()
+                command, slot = control
+                if command == CLOSE:
+                    break
+                for game, env in envs.items():
+                    if command == RESET:
+                        obs = env.reset(None if seed is None else seed + game)
+                        reward, done = 0, False
+                        score = 0
+                    else:
+                        obs, reward, done, info = env.step(actions[game])
+                        score = info['score']
+                        if done:
+                            obs = env.reset()
+                    arrays['obs'][slot, game] = obs
+                    arrays['reward'][slot, game] = reward
+                    arrays['done'][slot, game] = done
+                    arrays['score'][slot, game] = score
+                    if frames is not None:
+                        frames[slot, game] = env.frame()
+                finished.release()
+        finally:
+            # a failing worker exits with an error code, the parent sees it while waiting
+            del arrays, control, actions, frames
+            shm.close()
+
+    def run(self, command):
+        """run one command on every worker and wait for all of them, returns the slot written"""
+        slot = self.slot
+        self.slot = (self.slot + 1) % self.ring
+        self.arrays['control'][:] = (command, slot)
+        for start in self.start:
+            start.release()
+        for _ in self.start:
+            while not self.finished.acquire(timeout=1):
+                dead = [process for process in self.processes if not process.is_alive()]
+                if dead:
+                    self.terminate()
+                    raise RuntimeError("rollout worker failed with exit code %s" % dead[0].exitcode)
+        return slot
+
+    def reset(self):
+        """reset every game, returns the observations"""
+        slot = self.run(RESET)
+        return self.arrays['obs'][slot]
+
+    def step(self, actions):
+        """step every game with an array of N flap flags.
+        returns observations, rewards, dones, scores (and frames when enabled) as shared memory views"""
+        self.arrays['actions'][:] = actions
+        slot = self.run(STEP)
+        result = (self.arrays['obs'][slot], self.arrays['reward'][slot],
+                  self.arrays['done'][slot], self.arrays['score'][slot])
+        if self.frames:
+            result += (self.arrays['frames'][slot],)
+        return result
+
+    def close(self):
+        """stop the workers and release the shared memory"""
+        if not self.processes:
+            return
+        self.arrays['control'][0] = CLOSE
+        for start in self.start:
+            start.release()
+        for process in self.processes:
+            process.join()
+        self.processes = []
+        self.release()
+
+    def terminate(self):
+        """kill the workers, one of them failed, and release the shared memory"""
+        for process in self.processes:
+            process.terminate()
+        for process in self.processes:
+            process.join()
+        self.processes = []
+        self.release()
+
+    def release(self):
+        """drop the views and free the shared memory block"""
+        self.arrays = None
+        self.shm.close()
+        self.shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def benchmark(steps=2000, envs_per_worker=8, frames=False, max_workers=None):
+    """steps per second of the farm for 1 up to max_workers worker processes, and speedup against 1 worker"""
+    max_workers = max_workers or mp.cpu_count()
+    results = []
+    rng = np.random.default_rng(0)
+    for workers in range(1, max_workers + 1):
+        with RolloutFarm(workers, envs_per_worker, frames=frames, seed=0) as farm:
+            farm.reset()
+            actions = rng.random((steps, farm.n)) < 0.08
+            start = time.perf_counter()
+            for step in range(steps):
+                farm.step(actions[step])
+            elapsed = time.perf_counter() - start
+        results.append({'workers': workers, 'envs': workers * envs_per_worker,
+                        'env_steps_per_s': steps * workers * envs_per_worker / elapsed})
+    for result in results:
+        result['speedup'] = result['env_steps_per_s'] / results[0]['env_steps_per_s']
+    return results
+
+
+if __name__ == '__main__':
+    print(json.dumps(benchmark(frames='--frames' in sys.argv), indent=2))
@@ -0,0 +1,121 @@
+import json
+import os
+import random
+import sys
+from array import array
+
+
+class GameParams:
+    """Physics and difficulty of the rounds of a game, checked on creation.
+
+    FPS is the number of simulation ticks per second, flap and gravity are in pixels per tick,
+    pipeSpeed is in pixels per second. Pipe gaps start between gapMinFactor and
+    gapMinFactor + gapRangeFactor of the ground height, minus the gap size."""
+
+    # name -> (type, minimum, maximum, default)
+    FIELDS = {
+        'FPS': (int, 1, 240, 30),
+        'PIPEGAPSIZE': (int, 1, 400, 100),
+        'playerFlapAcc': (int, -40, -1, -9),
+        'playerAccY': (int, 0, 10, 1),
+        'pipeSpeed': (float, 1.0, 1000.0, 128.0),
+        'gapMinFactor': (float, 0.0, 1.0, 0.2),
+        'gapRangeFactor': (float, 0.0, 1.0, 0.6),
+    }
+    __slots__ = tuple(FIELDS)
+
+    def __init__(self, **values):
+        unknown = set(values) - set(GameParams.FIELDS)
+        if unknown:
+            raise ValueError("unknown game parameters : %s" % ', '.join(sorted(unknown)))
+        for name, (kind, minimum, maximum, default) in GameParams.FIELDS.items():
+            value = values.get(name, default)
+            # JSON has no int / float distinction for whole numbers, but a float is no tick count
+            if isinstance(value, bool) or not isinstance(value, (int, float)) \
+                    or (kind is int and not isinstance(value, int)):
+                raise ValueError("game parameter %s must be %s : %r" % (name, kind.__name__, value))
+            if not minimum <= value <= maximum:
+                raise ValueError("game parameter %s must be between %s and %s : %r" % (name, minimum, maximum, value))
+            setattr(self, name, kind(value))
+        if self.gapMinFactor + self.gapRangeFactor > 1:
+            raise ValueError("pipe gaps go below the ground : gapMinFactor + gapRangeFactor > 1")
+
+    def load(path):
+        """GameParams of a JSON object file, missing parameters keep their default"""
+        with open(path) as f:
+            values = json.load(f)
+        if not isinstance(values, dict):
+            raise ValueError("%s : game parameters must be a JSON object" % path)
+        return GameParams(**values)
+
+    def as_dict(self):
+        return {name: getattr(self, name) for name in GameParams.FIELDS}
+
+    def replace(self, **changes):
+        """copy with some parameters changed"""
+        return GameParams(**dict(self.as_dict(), **changes))
+
+    def gapBounds(self, baseY):
+        """(lowest gap y, number of gap y values) of the pipes above a ground at baseY"""
+        gapRange = int(baseY * self.gapRangeFactor - self.PIPEGAPSIZE)
+        if gapRange < 1:
+            raise ValueError("pipe gap of %d does not fit in %d pixels" % (self.PIPEGAPSIZE, baseY * self.gapRangeFactor))
+        return int(baseY * self.gapMinFactor), gapRange
+
+    def __eq__(self, other):
+        return isinstance(other, GameParams) and self.as_dict() == other.as_dict()
+
+    def __repr__(self):
+        return 'GameParams(%s)' % ', '.join('%s=%r' % item for item in self.as_dict().items())
+
+
+class ParamFile:
+    """GameParams of a JSON file, read again when the file changes.
+    A changed file that is not valid is reported on stderr and the previous parameters are kept"""
+
+    def __init__(self, path):
+        self.path = path
+        self.stamp = os.stat(path).st_mtime_ns
+        self.params = GameParams.load(path)
+
+    def reload(self, validate=None):
+        """the parameters, from the file when its modification time changed.
+        validate(params) may reject them with a ValueError"""
+        try:
+            stamp = os.stat(self.path).st_mtime_ns
+        except OSError:
+            return self.params
+        if stamp == self.stamp:
+            return self.params
+        self.stamp = stamp
+        try:
+            params = GameParams.load(self.path)
+            if validate:
+                validate(params)
+            self.params = params
+        except (OSError, ValueError) as error:
+            print("%s : %s, keeping the previous game parameters" % (self.path, error), file=sys.stderr)
+        return self.params
+
+
+class PipeSchedule:
+    """Gap y of the successive pipes of a round, drawn in bulk from the round seed.
+    The same seed and gap bounds always give the same pipes, blocks are drawn as the round goes on"""
+
+    BLOCK = 64
+
+    def __init__(self, seed, gapMin, gapRange):
+        self.random = random.Random(seed)
+        self.population = range(gapMin, gapMin + gapRange)
+        self.gaps = array('i')
+        self.extend()
+
+    def extend(self):
+        """draw the next block of gaps"""
+        self.gaps.extend(self.random.choices(self.population, k=PipeSchedule.BLOCK))
+
+    def gap(self, index):
+        """gap y of the pipe spawned in position index of the round"""
+        while index >= len(self.gaps):
+            self.extend()
+        return self.gaps[index]
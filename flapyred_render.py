@@ -0,0 +1,160 @@
+import pygame as pg
+
+
+class DirtyRenderer:
+    """Renderer that only redraws the screen areas where a sprite appeared, moved, changed or vanished.
+
+    Sprites of a frame are kept in a display list and compared with the previous frame.
+    Changed areas are split into non overlapping rects, then the cached background and every sprite
+    crossing them are blitted again in the same order, clipped to the rect : the screen ends up
+    with exactly the pixels of a full redraw.
+
+    Sprites are queued once per simulation tick, each tick starts with tick(). A frame drawn between
+    two ticks moves the sprites queued with a key part of the way from their position of the previous tick."""
+
+    # a sprite moving further than this in one tick jumped (base wrap around, recycled pipe) : not interpolated
+    MAX_STEP = 32
+
+    def __init__(self, screen):
+        self.screen = screen
+        self.screenRect = screen.get_rect()
+        self.background = None  # background of the last frame drawn
+        self.items = []  # (image, rect) of the last frame drawn
+        self.tickBackground = None
+        self.tickItems = None  # (image, pos, key) queued by the last tick
+        self.previousItems = None  # (image, pos, key) queued by the tick before
+
+    def tick(self):
+        """start of a simulation tick : the sprites of the last tick become the previous ones.
+        A tick that queues no sprites keeps them still instead of replaying the last interpolation"""
+        self.previousItems = self.tickItems
+
+    def begin(self, background):
+        """start the sprites of a tick, on top of a static background drawn at (0, 0)"""
+        self.tickBackground = background
+        self.tickItems = []
+
+    def blit(self, image, pos, key=None):
+        """queue a sprite of the tick, in back to front order. key identifies a moving sprite from tick to tick"""
+        self.tickItems.append((image, pos, key))
+
+    def frame(self, alpha):
+        """(image, rect) of every sprite, alpha of the way from the previous tick to the last one"""
+        if alpha >= 1 or not self.previousItems:
+            return [(image, pg.Rect(pos, image.get_size())) for image, pos, key in self.tickItems]
+        previous = {key: pos for image, pos, key in self.previousItems if key is not None}
+        items = []
+        for image, pos, key in self.tickItems:
+            start = previous.get(key)
+            if start is not None and abs(pos[0] - start[0]) <= DirtyRenderer.MAX_STEP \
+                    and abs(pos[1] - start[1]) <= DirtyRenderer.MAX_STEP:
+                pos = (start[0] + (pos[0] - start[0]) * alpha, start[1] + (pos[1] - start[1]) * alpha)
+            items.append((image, pg.Rect(pos, image.get_size())))
+        return items
+
+    def end(self, alpha=1.0):
+        """draw a frame of the last tick, returns the screen areas that changed"""
+        if self.tickItems is None:
+            return []
+        items = self.frame(alpha)
+        dirty = self.dirtyRects(items)
+        self.background = self.tickBackground
+        self.items = items
+        for rect in dirty:
+            self.screen.set_clip(rect)
+            self.screen.blit(self.background, rect, rect)
+            for image, itemRect in items:
+                if rect.colliderect(itemRect):
+                    self.screen.blit(image, itemRect)
+        self.screen.set_clip(None)
+        return dirty
+
+    def dirtyRects(self, items):
+        """areas to redraw for a new frame"""
+        if self.tickBackground is not self.background:
+            return [self.screenRect]
+        return DirtyRenderer.changedRects(self.items, items, self.screenRect)
+
+    def changedRects(oldItems, newItems, screenRect):
+        """non overlapping rects covering every sprite that differs between two display lists"""
+        changed = []
+        for index in range(max(len(oldItems), len(newItems))):
+            old = oldItems[index] if index < len(oldItems) else None
+            new = newItems[index] if index < len(newItems) else None
+            if old is not None and new is not None and old[0] is new[0] and old[1] == new[1]:
+                continue
+            if old is not None and new is not None and old[1].colliderect(new[1]):
+                # a sprite moving by a few pixels : one rect covering both positions
+                rects = (old[1].union(new[1]),)
+            else:
+                rects = (item[1] for item in (old, new) if item is not None)
+            for rect in rects:
+                rect = rect.clip(screenRect)
+                if rect.width and rect.height:
+                    changed.append(rect)
+        dirty = []
+        for rect in changed:
+            pieces = [rect]
+            for done in dirty:
+                pieces = [piece for part in pieces for piece in DirtyRenderer.subtract(part, done)]
+            dirty += pieces
+        return dirty
+
+    def subtract(rect, other):
+        """parts of rect outside of other, as up to 4 rects"""
+        if not rect.colliderect(other):
+            return [rect]
+        parts = []
+        if other.top > rect.top:
+            parts.append(pg.Rect(rect.left, rect.top, rect.width, other.top - rect.top))
+        if other.bottom < rect.bottom:
+            parts.append(pg.Rect(rect.left, other.bottom, rect.width, rect.bottom - other.bottom))
+        top, bottom = max(rect.top, other.top), min(rect.bottom, other.bottom)
+        if other.left > rect.left:
+            parts.append(pg.Rect(rect.left, top, other.left - rect.left, bottom - top))
+        if other.right < rect.right:
+            parts.append(pg.Rect(other.right, top, rect.right - other.right, bottom - top))
+        return parts
+
+
+class FullRenderer(DirtyRenderer):
+    """Reference renderer : every frame redraws the background and all sprites on the whole screen"""
+
+    def dirtyRects(self, items):
+        return [self.screenRect]
+
+
+def benchmark(ticks=3000, seed=0, flap_every=12, frames_per_tick=1):
+    """mean frame time in ms of the full and dirty renderers on the same scripted headless game :
+    game tick, drawing and pg.display.update of the changed areas. Screens are compared after every frame.
+    With several frames per tick, frames are interpolated between ticks"""
+    import time
+    from flapyred import Flappy
+
+    results = {}
+    frames = {}
+    for renderer in (FullRenderer, DirtyRenderer):
+        game = Flappy(headless=True, render=True, seed=seed)
+        game.game_tick(Flappy.GameInput.IDLE)
+        game.RENDERER = renderer(game.SCREEN)
+        elapsed = 0
+        frames[renderer] = screens = []
+        for tick in range(ticks):
+            game_input = Flappy.GameInput.ACTION if tick % flap_every == 0 else Flappy.GameInput.IDLE
+            start = time.perf_counter()
+            game.game_update(game_input)
+            for frame in range(1, frames_per_tick + 1):
+                dirty = game.RENDERER.end(frame / frames_per_tick)
+                if dirty:
+                    pg.display.update(dirty)
+                elapsed += time.perf_counter() - start
+                screens.append(hash(pg.image.tobytes(game.SCREEN, 'RGB')))
+                start = time.perf_counter()
+        results[renderer.__name__] = elapsed * 1000 / (ticks * frames_per_tick)
+    results['identical'] = frames[FullRenderer] == frames[DirtyRenderer]
+    return results
+
+
+if __name__ == '__main__':
+    print(benchmark())
+    print(benchmark(frames_per_tick=2))
@@ -0,0 +1,154 @@
+import random
+import struct
+import sys
+
+from flapyred import Flappy
+from flapyred_params import GameParams
+
+# magic, version, seed, number of ticks, final score, crash tick, then the GameParams of the round
+# in GameParams.FIELDS order : FPS, PIPEGAPSIZE, playerFlapAcc, playerAccY, pipeSpeed, gapMinFactor, gapRangeFactor
+HEADER = struct.Struct('<4sBQIIIHHbBddd')
+MAGIC = b'FLPR'
+VERSION = 3  # 2 : pipe gaps come from the PipeSchedule of the round. 3 : GameParams of the round
+NO_CRASH = 0xFFFFFFFF
+
+
+class Replay:
+    """One FLY episode : the reset seed, the GameParams of the round and the flap flag of every tick,
+    packed 8 ticks per byte. score and crashTick are what the recording game reported,
+    crashTick counts steps from reset."""
+
+    def __init__(self, seed=None, actions=b'', ticks=0, score=0, crashTick=NO_CRASH, params=None):
+        if seed is None:
+            seed = random.getrandbits(63)
+        if not 0 <= seed < 1 << 64:
+            raise ValueError("replay seed must fit in 64 bits : %r" % seed)
+        self.seed = seed
+        self.params = params or GameParams()
+        self.actions = bytearray(actions)
+        self.ticks = ticks
+        self.score = score
+        self.crashTick = crashTick
+
+    def append(self, action):
+        """record the action of the next tick"""
+        if self.ticks % 8 == 0:
+            self.actions.append(0)
+        if action:
+            self.actions[-1] |= 1 << (self.ticks % 8)
+        self.ticks += 1
+
+    def action(self, tick):
+        return bool(self.actions[tick >> 3] >> (tick & 7) & 1)
+
+    def __iter__(self):
+        for tick in range(self.ticks):
+            yield self.action(tick)
+
+    def finish(self, score, crashTick=NO_CRASH):
+        """record the outcome reported by the game"""
+        self.score = score
+        self.crashTick = crashTick
+
+    def dumps(self):
+        return HEADER.pack(MAGIC, VERSION, self.seed, self.ticks, self.score, self.crashTick,
+                           *self.params.as_dict().values()) + bytes(self.actions)
+
+    def loads(data):
+        replay = Replay.read_from(memoryview(data))
+        if replay is None:
+            raise ValueError("empty replay")
+        return replay
+
+    def read_from(data, offset=0):
+        """parse the replay at offset of a buffer, returns None at the end of the buffer.
+        Replays are self delimited, so many of them can be concatenated in one file"""
+        if offset >= len(data):
+            return None
+        if len(data) - offset < HEADER.size:
+            raise ValueError("truncated replay : %d bytes left for a %d bytes header"
+                             % (len(data) - offset, HEADER.size))
+        magic, version, seed, ticks, score, crashTick, *params = HEADER.unpack_from(data, offset)
+        if magic != MAGIC:
+            raise ValueError("not a flapyred replay")
+        if version != VERSION:
+            raise ValueError("flapyred replay version %d, version %d expected" % (version, VERSION))
+        params = GameParams(**dict(zip(GameParams.FIELDS, params)))
+        start = offset + HEADER.size
+        actions = data[start:start + (ticks + 7) // 8]
+        if len(actions) != (ticks + 7) // 8:
+            raise ValueError("truncated replay : %d ticks need %d bytes of actions, %d left"
+                             % (ticks, (ticks + 7) // 8, len(actions)))
+        return Replay(seed, actions, ticks, score, crashTick, params)
+
+    def size(self):
+        """number of bytes of the binary form"""
+        return HEADER.size + len(self.actions)
+
+
+def save(path, replays):
+    """write replays one after the other in a file"""
+    with open(path, 'wb') as f:
+        for replay in replays:
+            f.write(replay.dumps())
+
+
+def load(path):
+    """read every replay of a file"""
+    with open(path, 'rb') as f:
+        data = memoryview(f.read())
+    replays, offset = [], 0
+    replay = Replay.read_from(data)
+    while replay is not None:
+        replays.append(replay)
+        offset += replay.size()
+        replay = Replay.read_from(data, offset)
+    return replays
+
+
+def record(policy, seed=None, max_ticks=100000, game=None):
+    """play one episode with policy(observation) -> action, returns its Replay"""
+    game = game or Flappy(headless=True, render=False)
+    replay = Replay(seed)
+    obs = game.reset(replay.seed)
+    # parameters of the round, a parameter file is read again by reset()
+    replay.params = game.PARAMS
+    for tick in range(1, max_ticks + 1):
+        action = policy(obs)
+        replay.append(action)
+        obs, reward, done, info = game.step(action)
+        if done:
+            replay.finish(info['score'], tick)
+            break
+    else:
+        replay.finish(game.score)
+    return replay
+
+
+def resimulate(replay, game=None):
+    """replay the actions headless without rendering, with the GameParams of the replay.
+    returns (score, crash tick)"""
+    game = game or Flappy(headless=True, render=False, params=replay.params)
+    if game.PARAMS_FILE is not None:
+        raise ValueError("replays are re-simulated with their own game parameters, not a parameter file")
+    if game.PARAMS != replay.params:
+        game.apply_params(replay.params)
+    game.reset(replay.seed)
+    for tick, action in enumerate(replay, 1):
+        obs, reward, done, info = game.step(action)
+        if done:
+            return info['score'], tick
+    return game.score, NO_CRASH
+
+
+def verify(replay, game=None):
+    """True when re-simulation gives the recorded score and crash tick"""
+    return resimulate(replay, game) == (replay.score, replay.crashTick)
+
+
+if __name__ == '__main__':
+    game = Flappy(headless=True, render=False)
+    for path in sys.argv[1:]:
+        replays = load(path)
+        failed = sum(not verify(replay, game) for replay in replays)
+        print("%s : %d replays, %d mismatch" % (path, len(replays), failed))
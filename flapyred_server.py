@@ -0,0 +1,340 @@
+import argparse
+import asyncio
+import json
+import multiprocessing as mp
+import random
+import socket
+import struct
+import time
+from array import array
+
+from flapyred import Flappy
+
+# every message : payload length, message type, then the payload
+FRAME = struct.Struct('<IB')
+# message types
+OPEN = 1  # client : count, ticks per second, seed (-1 for random seeds). server : count, then the session ids
+ACTIONS = 2  # client : count, then (session id, flap) pairs
+STATES = 3  # server : count, then one STATE per session ticked
+CLOSE = 4  # client : count, then the session ids
+STATS = 5  # client : empty. server : SERVER_STATS
+RESET_STATS = 6  # client : empty. clears the window of tick lateness
+
+OPEN_REQUEST = struct.Struct('<HHq')
+COUNT = struct.Struct('<H')
+SESSION_ID = struct.Struct('<I')
+ACTION = struct.Struct('<IB')
+# session id, tick, reward, done, score, scheduled time of the tick (time.monotonic), observation
+STATE = struct.Struct('<Iib?Id%df' % Flappy.OBS_SIZE)
+# sessions, ticks run, CPU seconds of the server process, p50 / p99 / max tick lateness in ms
+SERVER_STATS = struct.Struct('<IQd3d')
+
+
+class Session:
+    """One headless game of the server, ticked on its own schedule"""
+    __slots__ = ('id', 'game', 'period', 'due', 'action', 'connection', 'timer')
+
+    def __init__(self, sessionId, seed, tickRate, connection):
+        self.id = sessionId
+        self.game = Flappy(headless=True, render=False)
+        self.game.reset(seed)
+        self.period = 1 / tickRate
+        self.due = 0.0
+        self.action = False  # flap requested since the last tick
+        self.connection = connection
+        self.timer = None
+
+
+class Connection:
+    """A client socket : its sessions and the STATE records waiting to be sent in one batch"""
+
+    def __init__(self, writer):
+        self.writer = writer
+        self.sessions = {}
+        self.states = []
+
+
+class GameServer:
+    """Hundreds of headless Flappy sessions in one asyncio event loop.
+
+    Each session has its own tick rate : a timer of the event loop runs its next tick and schedules
+    the following one. A tick uses the flap requested by the client since the previous tick, a finished
+    round starts again at once. STATE records of the ticks run by one loop iteration are sent
+    to each client in a single STATES message. A client that does not read them fast enough is
+    disconnected once MAX_BUFFER bytes wait to be sent to it."""
+
+    MAX_BUFFER = 1 << 20
+
+    def __init__(self, window=4096):
+        self.loop = None
+        self.nextId = 0
+        self.sessions = {}
+        self.ticks = 0
+        self.window = window
+        self.lateness = array('d', [0.0] * window)  # rolling window of tick lateness in seconds
+        self.samples = 0  # tick lateness measured since the last RESET_STATS
+
+    async def serve(self, host='127.0.0.1', port=8765, path=None):
+        """serve on a TCP port of localhost, or on a unix socket when path is given, until cancelled"""
+        self.loop = asyncio.get_running_loop()
+        if path:
+            server = await asyncio.start_unix_server(self.client, path)
+        else:
+            server = await asyncio.start_server(self.client, host, port)
+        async with server:
+            await server.serve_forever()
+
+    async def client(self, reader, writer):
+        connection = Connection(writer)
+        try:
+            while True:
+                length, kind = FRAME.unpack(await reader.readexactly(FRAME.size))
+                payload = await reader.readexactly(length)
+                self.handle(connection, kind, payload)
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError, struct.error):
+            pass
+        finally:
+            for session in list(connection.sessions.values()):
+                self.close(session)
+            writer.close()
+
+    def handle(self, connection, kind, payload):
+        if kind == ACTIONS:
+            sessions = connection.sessions
+            for sessionId, flap in ACTION.iter_unpack(payload[COUNT.size:]):
+                session = sessions.get(sessionId)
+                if session is not None and flap:
+                    session.action = True
+        elif kind == OPEN:
+            count, tickRate, seed = OPEN_REQUEST.unpack(payload)
+            if not tickRate:
+                raise ValueError("tick rate must be positive")
+            ids = []
+            now = self.loop.time()
+            for index in range(count):
+                session = Session(self.nextId, None if seed < 0 else seed + index, tickRate, connection)
+                self.nextId += 1
+                self.sessions[session.id] = connection.sessions[session.id] = session
+                # first ticks spread over a period : sessions opened together do not all tick at once
+                session.due = now + session.period * (index + 1) / count
+                session.timer = self.loop.call_at(session.due, self.tick, session)
+                ids.append(session.id)
+            GameServer.send(connection, OPEN, COUNT.pack(count) + b''.join(SESSION_ID.pack(i) for i in ids))
+        elif kind == CLOSE:
+            for (sessionId,) in SESSION_ID.iter_unpack(payload[COUNT.size:]):
+                session = connection.sessions.get(sessionId)
+                if session is not None:
+                    self.close(session)
+        elif kind == STATS:
+            GameServer.send(connection, STATS, SERVER_STATS.pack(len(self.sessions), self.ticks,
+                                                                 time.process_time(), *self.latenessStats()))
+        elif kind == RESET_STATS:
+            self.samples = 0
+        else:
+            raise ValueError("unknown message type %d" % kind)
+
+    def tick(self, session):
+        """timer of a session : run one FLY tick, queue its STATE record and schedule the next tick"""
+        now = self.loop.time()
+        due = session.due
+        self.lateness[self.samples % self.window] = now - due
+        self.samples += 1
+        self.ticks += 1
+        obs, reward, done, info = session.game.step(session.action)
+        session.action = False
+        if done:
+            obs = session.game.reset()
+        connection = session.connection
+        if not connection.states:
+            # one STATES message for all the ticks of this loop iteration
+            self.loop.call_soon(GameServer.flush, connection)
+        connection.states.append(STATE.pack(session.id, info['tick'], reward, done, info['score'], due, *obs))
+        # an overloaded server skips the ticks it missed rather than running them late in a burst
+        session.due = max(due + session.period, now)
+        session.timer = self.loop.call_at(session.due, self.tick, session)
+
+    def flush(connection):
+        states, connection.states = connection.states, []
+        writer = connection.writer
+        if writer.is_closing():
+            return
+        if writer.transport.get_write_buffer_size() > GameServer.MAX_BUFFER:
+            # the client stopped reading : drop it with its unsent data rather than buffer without end.
+            # client() then closes its sessions
+            writer.transport.abort()
+            return
+        GameServer.send(connection, STATES, COUNT.pack(len(states)) + b''.join(states))
+
+    def send(connection, kind, payload):
+        connection.writer.write(FRAME.pack(len(payload), kind) + payload)
+
+    def close(self, session):
+        session.timer.cancel()
+        del self.sessions[session.id]
+        del session.connection.sessions[session.id]
+
+    def latenessStats(self):
+        """p50, p99 and max tick lateness in ms over the rolling window"""
+        recent = sorted(self.lateness[:min(self.samples, self.window)]) or [0.0]
+        return (recent[len(recent) // 2] * 1000, recent[min(len(recent) - 1, len(recent) * 99 // 100)] * 1000,
+                recent[-1] * 1000)
+
+
+class GameClient:
+    """Client side of the protocol : open sessions, send batched actions, read batched STATE records"""
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+
+    async def connect(host='127.0.0.1', port=8765, path=None):
+        if path:
+            reader, writer = await asyncio.open_unix_connection(path)
+        else:
+            reader, writer = await asyncio.open_connection(host, port)
+        return GameClient(reader, writer)
+
+    def send(self, kind, payload=b''):
+        self.writer.write(FRAME.pack(len(payload), kind) + payload)
+
+    async def receive(self):
+        """(message type, payload) of the next server message"""
+        length, kind = FRAME.unpack(await self.reader.readexactly(FRAME.size))
+        return kind, await self.reader.readexactly(length)
+
+    def open(self, count, tickRate=30, seed=-1):
+        """request count new sessions, the server answers with an OPEN message of their ids"""
+        self.send(OPEN, OPEN_REQUEST.pack(count, tickRate, seed))
+
+    def act(self, actions):
+        """send (session id, flap) pairs in one message"""
+        self.send(ACTIONS, COUNT.pack(len(actions)) + b''.join(ACTION.pack(s, a) for s, a in actions))
+
+    def close(self, ids):
+        self.send(CLOSE, COUNT.pack(len(ids)) + b''.join(SESSION_ID.pack(i) for i in ids))
+
+    def states(payload):
+        """STATE tuples of a STATES message"""
+        return STATE.iter_unpack(memoryview(payload)[COUNT.size:])
+
+    def ids(payload):
+        return [sessionId for (sessionId,) in SESSION_ID.iter_unpack(payload[COUNT.size:])]
+
+
+def serve(host='127.0.0.1', port=8765, path=None):
+    try:
+        asyncio.run(GameServer().serve(host, port, path))
+    except KeyboardInterrupt:
+        pass
+
+
+async def load_client(sessions, tickRate, seconds, host, port, path, flap=0.08, per_connection=64):
+    """run sessions split over several connections, answering every STATE with a random flap.
+    returns the tick latencies in ms (reception time - scheduled tick time) and the server statistics
+    at start and end of the measure"""
+    rng = random.Random(0)
+    latencies = array('d')
+    clients = []
+    for start in range(0, sessions, per_connection):
+        client = await GameClient.connect(host, port, path)
+        client.open(min(per_connection, sessions - start), tickRate)
+        kind, payload = await client.receive()
+        clients.append(client)
+    control = await GameClient.connect(host, port, path)
+
+    async def stats(reset=False):
+        if reset:
+            # server lateness of the measure only, not of the session creation and warm up
+            control.send(RESET_STATS)
+        control.send(STATS)
+        kind, payload = await control.receive()
+        return SERVER_STATS.unpack(payload), time.monotonic()
+
+    async def run(client, end):
+        while True:
+            kind, payload = await client.receive()
+            if kind != STATES:
+                continue
+            now = time.monotonic()
+            actions = []
+            for state in GameClient.states(payload):
+                latencies.append(now - state[5])
+                actions.append((state[0], rng.random() < flap))
+            client.act(actions)
+            if now >= end:
+                return
+
+    # one second of warm up, then the measure
+    warmup = time.monotonic() + 1
+    await asyncio.gather(*(run(client, warmup) for client in clients))
+    del latencies[:]
+    first = await stats(reset=True)
+    await asyncio.gather(*(run(client, time.monotonic() + seconds) for client in clients))
+    last = await stats()
+    for client in clients + [control]:
+        client.writer.close()
+    return latencies, first, last
+
+
+def wait_server(port, path, timeout=10):
+    """wait until the server accepts connections"""
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            if path:
+                sock = socket.socket(socket.AF_UNIX)
+                sock.connect(path)
+            else:
+                sock = socket.create_connection(('127.0.0.1', port))
+            sock.close()
+            return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.05)
+
+
+def load_test(sessions=(50, 100, 200, 400), tickRate=30, seconds=5, port=8766, path=None):
+    """start a server process, then for each number of sessions measure the tick latency seen by
+    the clients and the server CPU use. sessions_per_core extrapolates sessions to a fully used core"""
+    server = mp.Process(target=serve, args=('127.0.0.1', port, path), daemon=True)
+    server.start()
+    results = []
+    try:
+        wait_server(port, path)
+        for count in sessions:
+            latencies, first, last = asyncio.run(load_client(count, tickRate, seconds, '127.0.0.1', port, path))
+            (_, ticks0, cpu0, *_), wall0 = first
+            (_, ticks1, cpu1, p50, p99, worst), wall1 = last
+            cpu = (cpu1 - cpu0) / (wall1 - wall0)
+            recent = sorted(latencies) or [0.0]
+            results.append({
+                'sessions': count,
+                'ticks_per_s': (ticks1 - ticks0) / (wall1 - wall0),
+                'server_cpu': cpu,
+                'sessions_per_core': count / cpu if cpu else None,
+                'latency_p50_ms': recent[len(recent) // 2] * 1000,
+                'latency_p99_ms': recent[min(len(recent) - 1, len(recent) * 99 // 100)] * 1000,
+                'latency_max_ms': recent[-1] * 1000,
+                'server_lateness_p99_ms': p99,
+            })
+    finally:
+        server.terminate()
+        server.join()
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Flappy session server on localhost")
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--unix', help="serve on this unix socket path instead of a TCP port")
+    parser.add_argument('--load-test', action='store_true', help="start a server and measure it, results as JSON")
+    parser.add_argument('--sessions', default='50,100,200,400', help="session counts of the load test")
+    parser.add_argument('--rate', type=int, default=30, help="ticks per second of the load test sessions")
+    parser.add_argument('--seconds', type=float, default=5, help="measure time per session count")
+    args = parser.parse_args()
+    if args.load_test:
+        counts = tuple(int(count) for count in args.sessions.split(','))
+        print(json.dumps(load_test(counts, args.rate, args.seconds, args.port, args.unix), indent=2))
+    else:
+        serve(port=args.port, path=args.unix)
@@ -0,0 +1,107 @@
+import json
+import signal
+import sys
+from array import array
+from time import perf_counter
+
+PHASES = ('input', 'simulate', 'collision', 'draw', 'present')
+PHASE_INDEX = {phase: index for index, phase in enumerate(PHASES)}
+
+
+class GameStats:
+    """Per state timing of the game loop phases.
+
+    The loop calls frame_start() at the start of a frame, enter(phase) when a phase starts
+    (the time since the previous call goes to the phase left) and frame_end() once the frame is shown.
+    Frame times of each state are kept in a rolling window for percentiles, frames longer than
+    the budget are counted as missed deadlines. profile() runs cProfile for the next N frames."""
+
+    def __init__(self, budget, window=1024):
+        self.budget = budget
+        self.window = window
+        self.state = None
+        self.phase = 0
+        self.frameStart = self.lastMark = 0.0
+        self.phaseTime = {}  # state -> array of seconds per phase
+        self.frames = {}  # state -> [frame count, missed deadlines, rolling frame times]
+        self.profiler = None
+        self.profileFrames = 0
+        self.profilePath = None
+
+    def frame_start(self):
+        self.frameStart = self.lastMark = perf_counter()
+        self.phase = 0
+
+    def enter(self, phase):
+        """start of a phase : the time since the last mark goes to the phase left, in the current state"""
+        now = perf_counter()
+        times = self.phaseTime.get(self.state)
+        if times is None:
+            times = self.phaseTime[self.state] = array('d', [0.0] * len(PHASES))
+        times[self.phase] += now - self.lastMark
+        self.lastMark = now
+        self.phase = PHASE_INDEX[phase]
+
+    def frame_end(self):
+        """the frame is shown, what follows (waiting for the next frame) is not counted"""
+        self.enter('input')
+        frameTime = self.lastMark - self.frameStart
+        frames = self.frames.get(self.state)
+        if frames is None:
+            frames = self.frames[self.state] = [0, 0, array('d', [0.0] * self.window)]
+        frames[2][frames[0] % self.window] = frameTime
+        frames[0] += 1
+        if frameTime > self.budget:
+            frames[1] += 1
+        if self.profiler is not None:
+            self.profileFrames -= 1
+            if self.profileFrames <= 0:
+                self.profile_stop()
+
+    def dump(self):
+        """dict of the statistics of every state : frames, missed deadlines, p50/p99/max frame time
+        in ms over the rolling window and total ms per phase"""
+        result = {}
+        for state, (count, missed, times) in self.frames.items():
+            recent = sorted(times[:min(count, self.window)])
+            name = getattr(state, 'name', str(state))
+            result[name] = {
+                'frames': count,
+                'missed_deadlines': missed,
+                'p50_ms': recent[len(recent) // 2] * 1000,
+                'p99_ms': recent[min(len(recent) - 1, len(recent) * 99 // 100)] * 1000,
+                'max_ms': recent[-1] * 1000,
+                'phases_ms': {phase: total * 1000 for phase, total in zip(PHASES, self.phaseTime.get(state, ()))},
+            }
+        return result
+
+    def reset(self):
+        self.phaseTime.clear()
+        self.frames.clear()
+
+    def profile(self, frames, path=None):
+        """run cProfile for the next frames, then write the stats to path or print the top functions"""
+        if self.profiler is not None:
+            return
+        import cProfile
+        self.profileFrames = frames
+        self.profilePath = path
+        self.profiler = cProfile.Profile()
+        self.profiler.enable()
+
+    def profile_stop(self):
+        profiler, self.profiler = self.profiler, None
+        profiler.disable()
+        if self.profilePath:
+            profiler.dump_stats(self.profilePath)
+        else:
+            import io
+            import pstats
+            output = io.StringIO()
+            pstats.Stats(profiler, stream=output).sort_stats('cumulative').print_stats(25)
+            print(output.getvalue(), file=sys.stderr)
+
+    def install_signals(self, profile_frames=300):
+        """SIGUSR1 prints the statistics as JSON on stderr, SIGUSR2 profiles the next frames"""
+        signal.signal(signal.SIGUSR1, lambda signum, frame: print(json.dumps(self.dump()), file=sys.stderr))
+        signal.signal(signal.SIGUSR2, lambda signum, frame: self.profile(profile_frames))
@@ -0,0 +1,138 @@
+import argparse
+import multiprocessing as mp
+import os
+import sys
+import time
+from queue import Empty
+
+# raw frames may go to stdout : keep it free of the pygame banner
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+import pygame as pg
+
+from flapyred import Flappy
+import flapyred_replay
+
+
+def gap_policy(obs):
+    """flap when the bottom of the bird gets close to the bottom of the next gap"""
+    return obs[0] + 24 > obs[5] - 12
+
+
+def ticks(game, replay, tail):
+    """simulate a replay, yields once every tick is simulated and queued for drawing, nothing is drawn.
+    The first tick is the FLY start of reset(), then one per recorded action up to the crash,
+    then tail ticks of the game over animation"""
+    game.reset(replay.seed)
+    yield
+    for action in replay:
+        game.game_update(Flappy.GameInput.ACTION if action else Flappy.GameInput.IDLE)
+        yield
+        if game.GAME_STATE != Flappy.GameState.FLY:
+            break
+    for _ in range(tail):
+        game.game_update(Flappy.GameInput.IDLE)
+        yield
+
+
+def frames(replay, tail=0, worker=0, workers=1, chunk=64):
+    """(frame index, game) of the frames of one worker : chunks worker, worker + workers, ... of chunk frames.
+    The other chunks are only simulated. The screen of game holds the frame, until the next one"""
+    game = Flappy(headless=True, render=True, params=replay.params)
+    for index, _ in enumerate(ticks(game, replay, tail)):
+        if index // chunk % workers == worker:
+            game.game_render()
+            yield index, game
+
+
+def work(replay, tail, worker, workers, chunk, png, queue):
+    """worker process : send its frames as RGB bytes in its bounded queue, None marks the end of the replay.
+    Or save them as PNG files, then send the number of files"""
+    count = 0
+    for index, game in frames(replay, tail, worker, workers, chunk):
+        if png:
+            pg.image.save(game.SCREEN, png % index)
+            count += 1
+        else:
+            queue.put(pg.image.tobytes(game.SCREEN, 'RGB'))
+    queue.put(count if png else None)
+
+
+def receive(queue, process):
+    """next item of a worker queue, fails when the worker died"""
+    while True:
+        try:
+            return queue.get(timeout=1)
+        except Empty:
+            if not process.is_alive():
+                raise RuntimeError("render worker failed with exit code %s" % process.exitcode)
+
+
+def render(replay, output=None, png=None, tail=30, workers=1, chunk=64):
+    """render every frame of a replay headless, as fast as the CPU allows.
+    Frames are written as raw RGB (SCREENHEIGHT rows of SCREENWIDTH pixels) to the binary file output,
+    or saved as PNG files named png % frame index. Several worker processes each re-simulate
+    the replay and draw one chunk out of `workers` : memory stays bounded by the queues, whatever the
+    length of the replay. returns the number of frames"""
+    if workers <= 1:
+        count = 0
+        for index, game in frames(replay, tail):
+            if png:
+                pg.image.save(game.SCREEN, png % index)
+            else:
+                output.write(pg.image.tobytes(game.SCREEN, 'RGB'))
+            count += 1
+        return count
+
+    # raw frames go back to the parent in order : chunk c comes from the queue of worker c % workers
+    queues = [mp.Queue(chunk) for _ in range(workers)]
+    processes = [mp.Process(target=work, daemon=True, args=(replay, tail, worker, workers, chunk, png, queues[worker]))
+                 for worker in range(workers)]
+    for process in processes:
+        process.start()
+    count = 0
+    if png:
+        count = sum(receive(queue, process) for queue, process in zip(queues, processes))
+    else:
+        finished = False
+        while not finished:
+            worker = count // chunk % workers
+            for _ in range(chunk):
+                frame = receive(queues[worker], processes[worker])
+                if frame is None:
+                    finished = True
+                    break
+                output.write(frame)
+                count += 1
+    for process in processes:
+        process.join()
+        if process.exitcode:
+            raise RuntimeError("render worker failed with exit code %d" % process.exitcode)
+    return count
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Render a replay to raw RGB frames or PNG files, without window")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--replay', help="replay file, see flapyred_replay")
+    source.add_argument('--seed', type=int, help="record a round of this seed played by gap_policy")
+    parser.add_argument('--index', type=int, default=0, help="replay of the file to render")
+    parser.add_argument('--raw', default='-', help="raw RGB output file, - for stdout (default)")
+    parser.add_argument('--png', help="PNG file name pattern with the frame index, like frames/%%05d.png")
+    parser.add_argument('--tail', type=int, default=30, help="ticks of game over animation after the crash")
+    parser.add_argument('--workers', type=int, default=1, help="worker processes")
+    parser.add_argument('--chunk', type=int, default=64, help="consecutive frames drawn by one worker")
+    args = parser.parse_args()
+    if args.replay:
+        replay = flapyred_replay.load(args.replay)[args.index]
+    else:
+        replay = flapyred_replay.record(gap_policy, args.seed)
+    start = time.perf_counter()
+    if args.png:
+        count = render(replay, png=args.png, tail=args.tail, workers=args.workers, chunk=args.chunk)
+    elif args.raw == '-':
+        count = render(replay, sys.stdout.buffer, tail=args.tail, workers=args.workers, chunk=args.chunk)
+    else:
+        with open(args.raw, 'wb') as f:
+            count = render(replay, f, tail=args.tail, workers=args.workers, chunk=args.chunk)
+    elapsed = time.perf_counter() - start
+    print("%d frames in %.2fs : %.0f frames/s" % (count, elapsed, count / elapsed), file=sys.stderr)
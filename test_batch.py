@@ -0,0 +1,74 @@
+"""FlappyBatch against Flappy : same sprites and pipe gaps give the same observations, rewards and dones.
+Run from the repository root : sprites are loaded from relative paths"""
+import os
+import random
+
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+import numpy as np
+import pytest
+
+from flapyred import Flappy
+from flapyred_batch import FlappyBatch
+from flapyred_params import GameParams, PipeSchedule
+
+PACKS = {
+    'default': None,
+    'wide_fast': GameParams(PIPEGAPSIZE=130, pipeSpeed=200.0),
+    'fps60': GameParams(FPS=60, playerAccY=2),
+    'easy': GameParams(PIPEGAPSIZE=160),
+}
+
+
+class ScheduledBatch(FlappyBatch):
+    """FlappyBatch whose games take their gaps from the PipeSchedule of Flappy rounds, block after block"""
+
+    def __init__(self, schedules, **kwargs):
+        self.schedules = schedules
+        self.blocks = [0] * len(schedules)
+        super().__init__(len(schedules), **kwargs)
+
+    def randomGapY(self, games):
+        gaps = []
+        for game in games:
+            start = self.blocks[game] * PipeSchedule.BLOCK
+            self.blocks[game] += 1
+            gaps.append([self.schedules[game].gap(start + i) for i in range(PipeSchedule.BLOCK)])
+        return np.array(gaps)
+
+
+def twin(seed, params):
+    """a Flappy round and a ScheduledBatch of one game with its sprites and gaps, both after the FLY start tick"""
+    game = Flappy(headless=True, render=False, seed=seed, params=params)
+    obs = game.reset()
+    # hitmasks are all that matters to collision
+    player = [Flappy.ASSETS.hitmask(paths[0]) for paths in game.PLAYERS_LIST].index(game.HITMASKS['player'][0])
+    pipe = [Flappy.ASSETS.hitmask(path) for path in game.PIPES_LIST].index(game.HITMASKS['pipe'][1])
+    batch = ScheduledBatch([game.pipeSchedule], player=player, pipe=pipe, params=params)
+    # Flappy.reset() already ran the FLY start tick
+    batch.step([False])
+    return game, obs, batch
+
+
+@pytest.mark.parametrize('params', PACKS.values(), ids=PACKS.keys())
+def test_same_as_flappy(params, seeds=range(20), ticks=5000, noise=0.02):
+    """flap to stay above the bottom of the next gap, with some random flaps, up to the first crash"""
+    for seed in seeds:
+        game, obs, batch = twin(seed, params)
+        rng = random.Random(seed)
+        for tick in range(ticks):
+            assert np.array_equal(np.asarray(obs), batch.obs[0]), (seed, tick, list(obs), batch.obs[0])
+            action = obs[0] + 24 > obs[5] - 12 or rng.random() < noise
+            obs, reward, done, info = game.step(action)
+            _, rewards, dones, _ = batch.step([action])
+            assert (reward, done) == (rewards[0], dones[0]), (seed, tick)
+            if done:
+                break
+
+
+def test_first_pipes_after_reset():
+    """the 2 pipes of a new round, none of them passed yet"""
+    batch = FlappyBatch(4, seed=0)
+    for obs in (batch.obs, batch.reset(np.array([1, 3]))):
+        assert (obs[:, 3] == batch.SCREENWIDTH + 200 - batch.playerx).all()
+        assert (obs[:, 6] == batch.SCREENWIDTH + 200 + batch.SCREENWIDTH / 2 - batch.playerx).all()
+        assert (obs[:, 4] > 0).all() and (obs[:, 7] > 0).all()
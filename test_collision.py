@@ -0,0 +1,102 @@
+"""pixelCollision and the tiered pipe tests of checkCrash against the original pg.Rect clip and per pixel loop.
+Run from the repository root : sprites are loaded from relative paths"""
+import os
+import random
+
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+import pygame as pg
+import pytest
+
+from flapyred import Flappy
+
+POSITIONS = 1000
+
+# a rendering game : the original hitmasks came from the converted sprites
+GAME = Flappy(headless=True, render=True)
+GAME.reset(0)
+BIRDS = range(len(GAME.PLAYERS_LIST))
+PIPES = range(len(GAME.PIPES_LIST))
+
+
+def columnMask(image):
+    """original hitmask : mask[x][y] is true when pixel (x, y) is opaque"""
+    return [[bool(image.get_at((x, y))[3]) for y in range(image.get_height())] for x in range(image.get_width())]
+
+
+def referenceCollision(rect1, rect2, hitmask1, hitmask2):
+    """original pixelCollision"""
+    rect = rect1.clip(rect2)
+    if rect.width == 0 or rect.height == 0:
+        return False
+    x1, y1 = rect.x - rect1.x, rect.y - rect1.y
+    x2, y2 = rect.x - rect2.x, rect.y - rect2.y
+    for x in range(rect.width):
+        for y in range(rect.height):
+            if hitmask1[x1 + x][y1 + y] and hitmask2[x2 + x][y2 + y]:
+                return True
+    return False
+
+
+def sprites(bird, pipe):
+    """(images, column masks, row bitmasks) of the 3 frames of a bird and of the flipped and upright pipe"""
+    birdPaths, pipePath = GAME.PLAYERS_LIST[bird], GAME.PIPES_LIST[pipe]
+    birdImages = tuple(Flappy.ASSETS.image(path) for path in birdPaths)
+    pipeImages = (Flappy.ASSETS.image(pipePath, flipped=True), Flappy.ASSETS.image(pipePath))
+    return ((birdImages, tuple(columnMask(image) for image in birdImages),
+             tuple(Flappy.ASSETS.hitmask(path) for path in birdPaths)),
+            (pipeImages, tuple(columnMask(image) for image in pipeImages),
+             (Flappy.ASSETS.hitmask(pipePath, flipped=True), Flappy.ASSETS.hitmask(pipePath))))
+
+
+@pytest.mark.parametrize('side', (0, 1), ids=('upper', 'lower'))
+@pytest.mark.parametrize('frame', range(3))
+@pytest.mark.parametrize('pipe', PIPES)
+@pytest.mark.parametrize('bird', BIRDS)
+def test_pixel_collision(bird, pipe, frame, side):
+    """a bird frame against a pipe at random fractional positions overlapping the pipe rect or around it"""
+    (birdImages, birdColumns, birdMasks), (pipeImages, pipeColumns, pipeMasks) = sprites(bird, pipe)
+    birdW, birdH = birdImages[frame].get_size()
+    pipeW, pipeH = pipeImages[side].get_size()
+    rng = random.Random(hash((bird, pipe, frame, side)))
+    hits = 0
+    for _ in range(POSITIONS):
+        x1, y1 = rng.uniform(0, 100), rng.uniform(0, 400)
+        x2, y2 = x1 + rng.uniform(-pipeW - 2, birdW + 2), y1 + rng.uniform(-pipeH - 2, birdH + 2)
+        expected = referenceCollision(pg.Rect(x1, y1, birdW, birdH), pg.Rect(x2, y2, pipeW, pipeH),
+                                      birdColumns[frame], pipeColumns[side])
+        assert Flappy.pixelCollision(x1, y1, birdMasks[frame], x2, y2, pipeMasks[side]) == expected, \
+            (x1, y1, x2, y2)
+        hits += expected
+    # both outcomes are tested
+    assert 0 < hits < POSITIONS
+
+
+@pytest.mark.parametrize('pipe', PIPES)
+@pytest.mark.parametrize('bird', BIRDS)
+def test_check_crash(bird, pipe):
+    """checkCrash with a pipe pair around the bird, the edges of the gap close to it"""
+    (birdImages, birdColumns, birdMasks), (pipeImages, pipeColumns, pipeMasks) = sprites(bird, pipe)
+    birdW, birdH = birdImages[0].get_size()
+    pipeW, pipeH = pipeImages[0].get_size()
+    GAME.IMAGES['player'], GAME.IMAGES['pipe'] = birdImages, pipeImages
+    GAME.HITMASKS['player'], GAME.HITMASKS['pipe'] = birdMasks, pipeMasks
+    rng = random.Random(hash((bird, pipe)))
+    pipes = GAME.pipes
+    crashes = 0
+    for _ in range(POSITIONS):
+        frame = rng.randrange(len(birdImages))
+        px, py = GAME.playerx, rng.uniform(-2 * birdH, GAME.BASEY)
+        x = px + rng.uniform(-pipeW - 2, birdW + 2)
+        gapY = int(py + rng.uniform(-GAME.PIPEGAPSIZE - birdH, birdH))
+        pipes.clear()
+        pipes.spawn(x, gapY - pipeH, gapY + GAME.PIPEGAPSIZE)
+        playerRect = pg.Rect(px, py, birdW, birdH)
+        if py + birdH >= GAME.BASEY - 1:
+            expected = [True, True]
+        else:
+            expected = [any(referenceCollision(playerRect, pg.Rect(x, y, pipeW, pipeH),
+                                               birdColumns[frame], pipeColumns[side])
+                            for side, y in enumerate((gapY - pipeH, gapY + GAME.PIPEGAPSIZE))), False]
+        assert GAME.checkCrash({'x': px, 'y': py, 'index': frame}, pipes) == expected, (frame, px, py, x, gapY)
+        crashes += expected[0]
+    assert 0 < crashes < POSITIONS